@@ -0,0 +1,135 @@
+"""create product_search table
+
+Revision ID: 7c672fa33a52
+Revises: 8f1dde1c104f
+Create Date: 2022-07-12 16:02:18.730419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c672fa33a52'
+down_revision = '8f1dde1c104f'
+branch_labels = None
+depends_on = None
+
+
+PRODUCT_SEARCH_ROWS = """
+    SELECT p.id, p.name, p.description, p.image_url, p.price, p.calories,
+        pd.protein, pd.carbohydrates, pd.fat, p.tag_mask,
+        s.id, s.name, s.logo_url, s.lat, s.lng, s.x, s.y, s.z
+    FROM products AS p
+    JOIN product_details AS pd ON pd.product_id = p.id
+    JOIN stores AS s ON s.id = p.store_id
+"""
+
+
+def upgrade():
+    op.create_table('product_search',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.Column('image_url', sa.String(), nullable=False),
+        sa.Column('price', sa.Numeric(), nullable=False),
+        sa.Column('calories', sa.Integer(), nullable=False),
+        sa.Column('protein', sa.Integer(), nullable=False),
+        sa.Column('carbohydrates', sa.Integer(), nullable=False),
+        sa.Column('fat', sa.Integer(), nullable=False),
+        sa.Column('tag_mask', sa.Integer(), nullable=False),
+        sa.Column('store_id', sa.Integer(), nullable=False),
+        sa.Column('store_name', sa.String(), nullable=False),
+        sa.Column('logo_url', sa.String(), nullable=False),
+        sa.Column('lat', sa.Float(), nullable=False),
+        sa.Column('lng', sa.Float(), nullable=False),
+        sa.Column('x', sa.Float(), nullable=False),
+        sa.Column('y', sa.Float(), nullable=False),
+        sa.Column('z', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['store_id'], ['stores.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index('ix_product_search_price', 'product_search', ['price'])
+    op.create_index('ix_product_search_calories', 'product_search', ['calories'])
+    op.create_index('ix_product_search_protein', 'product_search', ['protein'])
+    op.create_index('ix_product_search_carbohydrates', 'product_search', ['carbohydrates'])
+    op.create_index('ix_product_search_fat', 'product_search', ['fat'])
+    op.create_index('ix_product_search_store_id', 'product_search', ['store_id'])
+    op.create_index('ix_product_search_lat_lng', 'product_search', ['lat', 'lng'])
+
+    op.execute(f"""
+        CREATE FUNCTION refresh_product_search(changed_product_id integer)
+        RETURNS void AS $$
+            DELETE FROM product_search WHERE product_id = changed_product_id;
+            INSERT INTO product_search
+            {PRODUCT_SEARCH_ROWS}
+            WHERE p.id = changed_product_id;
+        $$ LANGUAGE sql;
+    """)
+
+    op.execute("""
+        CREATE FUNCTION product_search_product_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM refresh_product_search(NEW.id);
+            IF TG_OP = 'UPDATE' AND OLD.id <> NEW.id THEN
+                PERFORM refresh_product_search(OLD.id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER product_search_product_changed
+        AFTER INSERT OR UPDATE ON products
+        FOR EACH ROW EXECUTE FUNCTION product_search_product_changed();
+    """)
+
+    op.execute("""
+        CREATE FUNCTION product_search_details_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM refresh_product_search(OLD.product_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM refresh_product_search(NEW.product_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER product_search_details_changed
+        AFTER INSERT OR UPDATE OR DELETE ON product_details
+        FOR EACH ROW EXECUTE FUNCTION product_search_details_changed();
+    """)
+
+    op.execute("""
+        CREATE FUNCTION product_search_store_changed() RETURNS trigger AS $$
+        BEGIN
+            UPDATE product_search
+            SET store_name = NEW.name, logo_url = NEW.logo_url,
+                lat = NEW.lat, lng = NEW.lng, x = NEW.x, y = NEW.y, z = NEW.z
+            WHERE store_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER product_search_store_changed
+        AFTER UPDATE ON stores
+        FOR EACH ROW EXECUTE FUNCTION product_search_store_changed();
+    """)
+
+    op.execute(f"INSERT INTO product_search {PRODUCT_SEARCH_ROWS}")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER product_search_store_changed ON stores")
+    op.execute("DROP FUNCTION product_search_store_changed()")
+    op.execute("DROP TRIGGER product_search_details_changed ON product_details")
+    op.execute("DROP FUNCTION product_search_details_changed()")
+    op.execute("DROP TRIGGER product_search_product_changed ON products")
+    op.execute("DROP FUNCTION product_search_product_changed()")
+    op.execute("DROP FUNCTION refresh_product_search(integer)")
+    op.drop_table('product_search')
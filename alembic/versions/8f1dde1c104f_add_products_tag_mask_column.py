@@ -0,0 +1,90 @@
+"""add products tag_mask column
+
+Revision ID: 8f1dde1c104f
+Revises: a3be4738bbbf
+Create Date: 2022-07-08 11:20:53.104877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f1dde1c104f'
+down_revision = 'a3be4738bbbf'
+branch_labels = None
+depends_on = None
+
+
+CATEGORIES = (
+    'Vegan', 'Vegeterian', 'Sugar Free',
+    'Gluten Free', 'Lactose Free', 'Pescatarian'
+)
+
+
+def upgrade():
+    op.add_column('tags', sa.Column('bit', sa.Integer(), nullable=True))
+    op.create_unique_constraint('tags_bit_key', 'tags', ['bit'])
+
+    tags = sa.table('tags', sa.column('label', sa.String), sa.column('bit', sa.Integer))
+    for bit, label in enumerate(CATEGORIES):
+        op.execute(tags.update().where(tags.c.label == label).values(bit=bit))
+
+    op.add_column('products', sa.Column(
+        'tag_mask', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("""
+        CREATE FUNCTION product_tag_mask(changed_product_id integer)
+        RETURNS void AS $$
+            UPDATE products
+            SET tag_mask = (
+                SELECT coalesce(bit_or(1 << t.bit), 0)
+                FROM product_tag AS pt
+                JOIN tags AS t ON t.id = pt.tag_id
+                WHERE pt.product_id = changed_product_id
+            )
+            WHERE id = changed_product_id;
+        $$ LANGUAGE sql;
+    """)
+
+    op.execute("""
+        CREATE FUNCTION product_tag_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM product_tag_mask(OLD.product_id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM product_tag_mask(NEW.product_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE TRIGGER product_tag_changed
+        AFTER INSERT OR UPDATE OR DELETE ON product_tag
+        FOR EACH ROW EXECUTE FUNCTION product_tag_changed();
+    """)
+
+    op.execute("""
+        UPDATE products AS p
+        SET tag_mask = masks.tag_mask
+        FROM (
+            SELECT pt.product_id, bit_or(1 << t.bit) AS tag_mask
+            FROM product_tag AS pt
+            JOIN tags AS t ON t.id = pt.tag_id
+            WHERE t.bit IS NOT NULL
+            GROUP BY pt.product_id
+        ) AS masks
+        WHERE masks.product_id = p.id
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER product_tag_changed ON product_tag")
+    op.execute("DROP FUNCTION product_tag_changed()")
+    op.execute("DROP FUNCTION product_tag_mask(integer)")
+    op.drop_column('products', 'tag_mask')
+    op.drop_constraint('tags_bit_key', 'tags', type_='unique')
+    op.drop_column('tags', 'bit')
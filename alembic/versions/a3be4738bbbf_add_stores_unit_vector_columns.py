@@ -0,0 +1,39 @@
+"""add stores unit vector columns
+
+Revision ID: a3be4738bbbf
+Revises: dcaea26f6194
+Create Date: 2022-07-05 14:37:09.562731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3be4738bbbf'
+down_revision = 'dcaea26f6194'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('stores', sa.Column('x', sa.Float(), nullable=True))
+    op.add_column('stores', sa.Column('y', sa.Float(), nullable=True))
+    op.add_column('stores', sa.Column('z', sa.Float(), nullable=True))
+
+    op.execute("""
+        UPDATE stores
+        SET x = cos(radians(lat)) * cos(radians(lng)),
+            y = cos(radians(lat)) * sin(radians(lng)),
+            z = sin(radians(lat))
+    """)
+
+    op.alter_column('stores', 'x', nullable=False)
+    op.alter_column('stores', 'y', nullable=False)
+    op.alter_column('stores', 'z', nullable=False)
+
+
+def downgrade():
+    op.drop_column('stores', 'z')
+    op.drop_column('stores', 'y')
+    op.drop_column('stores', 'x')
@@ -0,0 +1,40 @@
+"""add products search_vector column
+
+Revision ID: af6f7bffbc72
+Revises: f22fc21a50c5
+Create Date: 2022-07-22 13:08:57.416322
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'af6f7bffbc72'
+down_revision = 'f22fc21a50c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('products', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', name), 'A')"
+            " || setweight(to_tsvector('english', category), 'B')"
+            " || setweight(to_tsvector('english', description), 'C')",
+            persisted=True
+        ),
+        nullable=True
+    ))
+    op.create_index(
+        'ix_products_search_vector', 'products', ['search_vector'],
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_products_search_vector', table_name='products')
+    op.drop_column('products', 'search_vector')
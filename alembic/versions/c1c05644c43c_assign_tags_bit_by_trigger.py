@@ -0,0 +1,71 @@
+"""assign tags bit by trigger
+
+Revision ID: c1c05644c43c
+Revises: eb90cc40fae5
+Create Date: 2022-08-01 10:04:37.218553
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1c05644c43c'
+down_revision = 'eb90cc40fae5'
+branch_labels = None
+depends_on = None
+
+
+CATEGORIES = (
+    'Vegan', 'Vegeterian', 'Sugar Free',
+    'Gluten Free', 'Lactose Free', 'Pescatarian'
+)
+
+CATEGORIES_ARRAY = "ARRAY[{}]".format(
+    ", ".join(f"'{category}'" for category in CATEGORIES))
+
+
+def upgrade():
+    # Tags seeded after the tag_mask migration, or created later, get their
+    # bit from their label
+    op.execute(f"""
+        CREATE FUNCTION tag_bit() RETURNS trigger AS $$
+        BEGIN
+            NEW.bit := array_position({CATEGORIES_ARRAY}, NEW.label) - 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER tag_bit
+        BEFORE INSERT OR UPDATE OF label, bit ON tags
+        FOR EACH ROW EXECUTE FUNCTION tag_bit();
+    """)
+
+    op.execute("""
+        CREATE FUNCTION tag_bit_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM product_tag_mask(pt.product_id)
+            FROM product_tag AS pt
+            WHERE pt.tag_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER tag_bit_changed
+        AFTER UPDATE OF label, bit ON tags
+        FOR EACH ROW
+        WHEN (OLD.bit IS DISTINCT FROM NEW.bit)
+        EXECUTE FUNCTION tag_bit_changed();
+    """)
+
+    # Firing tag_bit and, where the bit changes, tag_bit_changed
+    op.execute("UPDATE tags SET label = label")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER tag_bit_changed ON tags")
+    op.execute("DROP FUNCTION tag_bit_changed()")
+    op.execute("DROP TRIGGER tag_bit ON tags")
+    op.execute("DROP FUNCTION tag_bit()")
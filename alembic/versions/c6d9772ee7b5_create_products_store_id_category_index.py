@@ -0,0 +1,26 @@
+"""create products store_id category index
+
+Revision ID: c6d9772ee7b5
+Revises: af6f7bffbc72
+Create Date: 2022-07-25 11:40:13.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d9772ee7b5'
+down_revision = 'af6f7bffbc72'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_products_store_id_category', 'products', ['store_id', 'category']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_products_store_id_category', table_name='products')
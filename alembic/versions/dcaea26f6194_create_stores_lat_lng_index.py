@@ -0,0 +1,24 @@
+"""create stores lat lng index
+
+Revision ID: dcaea26f6194
+Revises: 6d0592656952
+Create Date: 2022-07-04 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dcaea26f6194'
+down_revision = '6d0592656952'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_stores_lat_lng', 'stores', ['lat', 'lng'])
+
+
+def downgrade():
+    op.drop_index('ix_stores_lat_lng', table_name='stores')
@@ -0,0 +1,93 @@
+"""add version & updated_at columns
+
+Revision ID: eb90cc40fae5
+Revises: c6d9772ee7b5
+Create Date: 2022-07-27 15:21:06.584390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'eb90cc40fae5'
+down_revision = 'c6d9772ee7b5'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('stores', 'products', 'product_details')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column(
+            'version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column(
+            'updated_at', sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'), nullable=False))
+
+    op.execute("""
+        CREATE FUNCTION touch_row() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            NEW.updated_at := now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_touch_row
+            BEFORE UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION touch_row();
+        """)
+
+    # A store's menu is its products, so writing one touches the store
+    op.execute("""
+        CREATE FUNCTION touch_product_store() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE stores SET updated_at = now() WHERE id = OLD.store_id;
+            END IF;
+            IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE'
+                    AND OLD.store_id <> NEW.store_id) THEN
+                UPDATE stores SET updated_at = now() WHERE id = NEW.store_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER products_touch_store
+        AFTER INSERT OR UPDATE OR DELETE ON products
+        FOR EACH ROW EXECUTE FUNCTION touch_product_store();
+    """)
+
+    # Touching a store changes none of the columns product_search copies
+    op.execute("DROP TRIGGER product_search_store_changed ON stores")
+    op.execute("""
+        CREATE TRIGGER product_search_store_changed
+        AFTER UPDATE OF name, logo_url, lat, lng, x, y, z ON stores
+        FOR EACH ROW EXECUTE FUNCTION product_search_store_changed();
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER product_search_store_changed ON stores")
+    op.execute("""
+        CREATE TRIGGER product_search_store_changed
+        AFTER UPDATE ON stores
+        FOR EACH ROW EXECUTE FUNCTION product_search_store_changed();
+    """)
+
+    op.execute("DROP TRIGGER products_touch_store ON products")
+    op.execute("DROP FUNCTION touch_product_store()")
+
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_touch_row ON {table}")
+    op.execute("DROP FUNCTION touch_row()")
+
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
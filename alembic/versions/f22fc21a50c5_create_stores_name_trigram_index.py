@@ -0,0 +1,38 @@
+"""create stores name trigram index
+
+Revision ID: f22fc21a50c5
+Revises: 7c672fa33a52
+Create Date: 2022-07-19 09:46:30.281957
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f22fc21a50c5'
+down_revision = '7c672fa33a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Without pg_trgm, /search keeps matching names with ILIKE
+    available = op.get_bind().execute(sa.text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'
+        )
+    """)).scalar()
+    if not available:
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_stores_name_trgm', 'stores', ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_stores_name_trgm")
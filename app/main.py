@@ -8,8 +8,12 @@ from datetime import datetime, timedelta
 from app.routers.user import users
 from app.routers.store import stores
 from app.routers.product import products
+from app.routers.metrics import metrics
+from app.routers.autocomplete import autocomplete
 from app.models import SessionLocal
 from app.models.recents import recents
+from app.utils import catalog, completions, passwords, recents_buffer, store_index
+from app.utils.config import settings
 
 
 app = FastAPI()
@@ -25,6 +29,8 @@ app.add_middleware(
 app.include_router(users)
 app.include_router(stores)
 app.include_router(products)
+app.include_router(metrics)
+app.include_router(autocomplete)
 
 
 @app.exception_handler(RequestValidationError)
@@ -37,6 +43,23 @@ def validation_exception_handler(request, exc):
     )
 
 
+@app.on_event("shutdown")
+def shutdown_password_hashing():
+    passwords.pool.shutdown()
+
+
+@app.on_event("startup")
+def start_recents_buffer():
+    if settings.recents_write_behind_enabled:
+        recents_buffer.buffer.start()
+
+
+@app.on_event("shutdown")
+def drain_recents_buffer():
+    if settings.recents_write_behind_enabled:
+        recents_buffer.buffer.stop()
+
+
 @app.on_event("startup")
 @repeat_every(seconds=60*60)
 def delete_expired_recents():
@@ -51,3 +74,36 @@ def delete_expired_recents():
             db.commit()
     except Exception as exc:
         print(exc)
+
+
+@app.on_event("startup")
+@repeat_every(seconds=settings.store_index_refresh_seconds)
+def refresh_store_index():
+    if not settings.store_index_enabled:
+        return
+
+    try:
+        store_index.refresh()
+    except Exception as exc:
+        print(exc)
+
+
+@app.on_event("startup")
+@repeat_every(seconds=settings.catalog_refresh_seconds)
+def reload_catalog():
+    if not settings.catalog_engine_enabled:
+        return
+
+    try:
+        catalog.reload()
+    except Exception as exc:
+        print(exc)
+
+
+@app.on_event("startup")
+@repeat_every(seconds=settings.autocomplete_refresh_seconds)
+def rebuild_completions():
+    try:
+        completions.rebuild()
+    except Exception as exc:
+        print(exc)
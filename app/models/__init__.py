@@ -24,6 +24,8 @@ from .tag import Tag
 from .product_tag import product_tag
 from .recents import recents
 from .favorites import favorites
+from .product_search import product_search
+from . import events
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,68 @@
+import itertools
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+# The column values of an instance written by a flush, captured before the
+# commit expires or detaches it, whether the flush deleted it, and the values
+# the flush replaced, for the columns it updated.
+Change = namedtuple("Change", ["model", "values", "deleted", "previous"])
+
+_listeners = []
+
+
+def on_commit(*models):
+    """
+    Registers the decorated fn(changes) to be called after every commit that
+    inserted, updated or deleted instances of `models`.
+    """
+    def decorator(fn):
+        _listeners.append((models, fn))
+        return fn
+    return decorator
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+    changes = session.info.setdefault("changes", [])
+    written = itertools.chain(
+        ((instance, False) for instance in session.new),
+        ((instance, False) for instance in session.dirty),
+        ((instance, True) for instance in session.deleted)
+    )
+    for instance, deleted in written:
+        state = inspect(instance)
+        values = {
+            attr.key: state.dict.get(attr.key)
+            for attr in state.mapper.column_attrs
+        }
+        previous = {
+            attr.key: state.attrs[attr.key].history.deleted[0]
+            for attr in state.mapper.column_attrs
+            if state.attrs[attr.key].history.deleted
+        }
+        changes.append(Change(type(instance), values, deleted, previous))
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("changes", None)
+
+
+@event.listens_for(Session, "after_commit")
+def dispatch_changes(session):
+    changes = session.info.pop("changes", [])
+    if not changes:
+        return
+
+    for models, fn in _listeners:
+        relevant = [change for change in changes
+            if issubclass(change.model, models)]
+        if not relevant:
+            continue
+
+        try:
+            fn(relevant)
+        except Exception as exc:
+            print(exc)
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, Computed, Index, TIMESTAMP, FetchedValue
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func
 from . import Base
 from .product_tag import product_tag
 
@@ -16,9 +18,30 @@ class Product(Base):
     category = Column(String, nullable=False)  # Menu Category
     store_id = Column(Integer, ForeignKey(
         "stores.id", ondelete="CASCADE"), nullable=False)
+    # Bit i is set when the product has the tag of CATEGORIES[i]. Maintained
+    # by a trigger on product_tag.
+    tag_mask = Column(Integer, nullable=False, server_default="0")
+    # Only read by full-text search, so not loaded with the product
+    search_vector = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', name), 'A')"
+        " || setweight(to_tsvector('english', category), 'B')"
+        " || setweight(to_tsvector('english', description), 'C')",
+        persisted=True
+    )))
+    # Bumped by a trigger on every update, for ETags and Last-Modified
+    version = Column(Integer, nullable=False, server_default="1",
+        server_onupdate=FetchedValue())
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+        server_default=func.now(), server_onupdate=FetchedValue())
 
     details = relationship("ProductDetails", uselist=False)
     store = relationship("Store", back_populates="products")
     tags = relationship(
         "Tag", secondary=product_tag, back_populates="products"
     )
+
+    __table_args__ = (
+        Index("ix_products_search_vector", "search_vector",
+            postgresql_using="gin"),
+        Index("ix_products_store_id_category", "store_id", "category"),
+    )
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, TIMESTAMP, FetchedValue
+from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from . import Base
 
@@ -16,3 +17,8 @@ class ProductDetails(Base):
     saturated_fat = Column(Float)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"),
         unique=True, nullable=False)
+    # Bumped by a trigger on every update, for ETags and Last-Modified
+    version = Column(Integer, nullable=False, server_default="1",
+        server_onupdate=FetchedValue())
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+        server_default=func.now(), server_onupdate=FetchedValue())
@@ -0,0 +1,38 @@
+from sqlalchemy import Table, Column, ForeignKey, Index, Integer, String, Numeric, Float
+from . import Base
+
+
+# One row per product with details, joined with its details, tag mask and
+# store, so /filter reads a single relation. Kept current by triggers on
+# products, product_details and stores.
+product_search = Table(
+    "product_search",
+    Base.metadata,
+    Column("product_id", ForeignKey("products.id", ondelete="CASCADE"),
+        primary_key=True),
+    Column("name", String, nullable=False),
+    Column("description", String, nullable=False),
+    Column("image_url", String, nullable=False),
+    Column("price", Numeric, nullable=False),
+    Column("calories", Integer, nullable=False),
+    Column("protein", Integer, nullable=False),
+    Column("carbohydrates", Integer, nullable=False),
+    Column("fat", Integer, nullable=False),
+    Column("tag_mask", Integer, nullable=False),
+    Column("store_id", ForeignKey("stores.id", ondelete="CASCADE"),
+        nullable=False),
+    Column("store_name", String, nullable=False),
+    Column("logo_url", String, nullable=False),
+    Column("lat", Float, nullable=False),
+    Column("lng", Float, nullable=False),
+    Column("x", Float, nullable=False),
+    Column("y", Float, nullable=False),
+    Column("z", Float, nullable=False),
+    Index("ix_product_search_price", "price"),
+    Index("ix_product_search_calories", "calories"),
+    Index("ix_product_search_protein", "protein"),
+    Index("ix_product_search_carbohydrates", "carbohydrates"),
+    Index("ix_product_search_fat", "fat"),
+    Index("ix_product_search_store_id", "store_id"),
+    Index("ix_product_search_lat_lng", "lat", "lng")
+)
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, Index, TIMESTAMP, FetchedValue, event
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.utils import geo
 from . import Base
 
 
@@ -12,6 +14,16 @@ class Store(Base):
     location = Column(String, nullable=False)
     lat = Column(Float, nullable=False)
     lng = Column(Float, nullable=False)
+    # (lat, lng) on the unit sphere, so distances reduce to dot products
+    x = Column(Float, nullable=False)
+    y = Column(Float, nullable=False)
+    z = Column(Float, nullable=False)
+    # Bumped by a trigger on every update, and on every write to the store's
+    # products, for ETags and Last-Modified
+    version = Column(Integer, nullable=False, server_default="1",
+        server_onupdate=FetchedValue())
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
+        server_default=func.now(), server_onupdate=FetchedValue())
 
     products = relationship(
         "Product",
@@ -19,3 +31,18 @@ class Store(Base):
         order_by="desc(Product.category)",
         cascade="all, delete"
     )
+
+    __table_args__ = (
+        Index("ix_stores_lat_lng", "lat", "lng"),
+        Index(
+            "ix_stores_name_trgm", "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+    )
+
+
+@event.listens_for(Store, "before_insert")
+@event.listens_for(Store, "before_update")
+def set_unit_vector(mapper, connection, target):
+    target.x, target.y, target.z = geo.unit_vector(target.lat, target.lng)
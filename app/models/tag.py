@@ -1,14 +1,31 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, FetchedValue
 from sqlalchemy.orm import relationship
 from . import Base
 from .product_tag import product_tag
 
 
+# The dietary categories, each one's index being its bit in Product.tag_mask
+CATEGORIES = (
+    'Vegan', 'Vegeterian', 'Sugar Free',
+    'Gluten Free', 'Lactose Free', 'Pescatarian'
+)
+
+
+def categories_mask(categories):
+    mask = 0
+    for category in categories:
+        mask |= 1 << CATEGORIES.index(category)
+    return mask
+
+
 class Tag(Base):
     __tablename__ = "tags"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     label = Column(String, unique=True, nullable=False)
+    # Index of the label in CATEGORIES, set by a trigger
+    bit = Column(Integer, unique=True,
+        server_default=FetchedValue(), server_onupdate=FetchedValue())
 
     products = relationship(
         "Product", secondary=product_tag, back_populates="tags"
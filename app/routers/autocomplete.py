@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from app.schemas import AutocompleteOut
+from app.utils import completions
+from app.utils.config import settings
+
+
+autocomplete = APIRouter(
+    tags=['Autocomplete']
+)
+
+
+class CompletionsUnavailable(Exception):
+    pass
+
+
+@autocomplete.get("/autocomplete", response_model=AutocompleteOut)
+def read_autocomplete(q: str, limit: int = 10):
+    try:
+        index = completions.get()
+        if index is None:
+            raise CompletionsUnavailable("Completions are not available.")
+
+        limit = min(limit, settings.autocomplete_max_limit)
+        return {"completions": index.complete(q, limit)}
+    except CompletionsUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load completions.")
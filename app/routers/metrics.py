@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from app.utils import stats
+
+
+metrics = APIRouter(
+    tags=['Metrics']
+)
+
+
+@metrics.get("/metrics")
+def read_metrics():
+    return stats.collect()
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy import select, text
-from sqlalchemy.orm import Session
-from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import bindparam, select, text, tuple_
+from sqlalchemy.orm import Session, joinedload
 from app.models import get_db
 from app.models.product import Product
 from app.models.product_details import ProductDetails
+from app.models.tag import categories_mask
 from app.models.recents import recents
 from app.models.favorites import favorites
-from app.schemas import ProductOutSimple, ProductOutDetailed, FavoritesOut, RecentsOut, FavoritesCreate, RecentsCreate, Filters, FilterOut
-from app.utils import auth
+from app.models.product_search import product_search
+from app.schemas import ProductOutSimple, ProductOutDetailed, ProductsOut, FavoritesOut, RecentsOut, FavoritesCreate, RecentsCreate, Filters, FilterOut
+from app.utils import auth, batch, catalog, conditional, facet_counts, filter_cache, geo, ndjson, pagination, product_cache, recents_buffer, statements, store_index
+from app.utils.config import settings
 
 
 products = APIRouter(
@@ -25,20 +28,78 @@ class ProductDetailsMissing(Exception):
 
 
 def get_product_by_id(db: Session, product_id: int):
-    return db.query(Product).filter(Product.id == product_id).first()
+    return (
+        db.query(Product)
+            .options(joinedload(Product.details), joinedload(Product.store))
+            .filter(Product.id == product_id)
+            .first()
+    )
 
 
-@products.get("/products/{id}", response_model=ProductOutDetailed)
-def read_product(id: int, db: Session = Depends(get_db)):
-    try:
-        db_product = get_product_by_id(db, product_id=id)
-        if not db_product:
-            raise ProductDoesNotExist("Product not found.")
+def load_product_out(db: Session, product_id: int):
+    """
+    Loads the (ProductOutDetailed dict, ETag, Last-Modified) of the product
+    into the product cache.
+    """
+    loaded_at = product_cache.generation()
+    db_product = get_product_by_id(db, product_id=product_id)
+    if not db_product:
+        raise ProductDoesNotExist("Product not found.")
+
+    if not db_product.details:
+        raise ProductDetailsMissing("Product details missing.")
+
+    etag = conditional.etag(db_product.version,
+        db_product.details.version, db_product.store.version)
+    last_modified = max(db_product.updated_at,
+        db_product.details.updated_at, db_product.store.updated_at)
+    product = (
+        ProductOutDetailed.from_orm(db_product).dict(), etag, last_modified)
 
-        if not db_product.details:
-            raise ProductDetailsMissing("Product details missing.")
+    product_cache.set(product_id, product, loaded_at)
+    return product
 
-        return db_product
+
+def get_product_version(db: Session, product_id: int):
+    return db.execute(text("""
+        SELECT p.version, pd.version AS details_version,
+            s.version AS store_version,
+            GREATEST(p.updated_at, pd.updated_at, s.updated_at) AS updated_at
+        FROM products AS p
+        JOIN product_details AS pd ON pd.product_id = p.id
+        JOIN stores AS s ON s.id = p.store_id
+        WHERE p.id = :id
+    """), {"id": product_id}).first()
+
+
+@products.get("/products/{id}", response_model=ProductOutDetailed)
+def read_product(id: int, response: Response,
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        db: Session = Depends(get_db)):
+    try:
+        # Hot products are served from the cache, without the database
+        cached = product_cache.get(id)
+
+        # Revalidating only needs the versions, not the product
+        if cached is None and (
+                if_none_match is not None or if_modified_since is not None):
+            db_version = get_product_version(db, product_id=id)
+            if db_version is not None:
+                etag = conditional.etag(db_version.version,
+                    db_version.details_version, db_version.store_version)
+                if conditional.not_modified(if_none_match, if_modified_since,
+                        etag, db_version.updated_at):
+                    return conditional.not_modified_response(
+                        etag, db_version.updated_at)
+
+        product, etag, last_modified = cached or load_product_out(db, id)
+        if conditional.not_modified(if_none_match, if_modified_since,
+                etag, last_modified):
+            return conditional.not_modified_response(etag, last_modified)
+
+        response.headers.update(conditional.headers(etag, last_modified))
+        return product
     except ProductDoesNotExist as error:
         raise HTTPException(status_code=404, detail=str(error))
     except ProductDetailsMissing as error:
@@ -47,47 +108,177 @@ def read_product(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Failed to load product.")
 
 
+def get_products_by_ids(db: Session, product_ids: list[int]):
+    return (
+        db.query(Product)
+            .options(joinedload(Product.details), joinedload(Product.store))
+            .filter(Product.id.in_(product_ids))
+            .all()
+    )
+
+
+@products.get("/products", response_model=ProductsOut)
+def read_products(ids: str, db: Session = Depends(get_db)):
+    try:
+        product_ids = batch.parse_ids(ids)
+
+        # Products without details cannot be shown, so they count as missing
+        db_products = {
+            db_product.id: db_product
+            for db_product in get_products_by_ids(db, product_ids)
+            if db_product.details
+        }
+
+        return {
+            "products": [db_products[product_id]
+                for product_id in product_ids if product_id in db_products],
+            "missing": [product_id
+                for product_id in product_ids if product_id not in db_products]
+        }
+    except batch.InvalidIds as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load products.")
+
+
 @products.get("/favorites", response_model=FavoritesOut)
-def read_favorites(current_user = Depends(auth.get_current_user)):
-    return current_user
+def read_favorites(cursor: Optional[str] = None, limit: Optional[int] = None,
+        db: Session = Depends(get_db),
+        current_user_id = Depends(auth.get_current_user_id)):
+    try:
+        stmt = (
+            select(Product)
+            .join(favorites, favorites.c.product_id == Product.id)
+            .where(favorites.c.user_id == current_user_id)
+            .options(joinedload(Product.store))
+            .order_by(Product.id)
+            .limit(limit)
+        )
+
+        if cursor is not None:
+            _, cursor_id = pagination.decode_cursor(
+                cursor, 'favorites', pagination.no_key)
+            stmt = stmt.where(Product.id > cursor_id)
+
+        db_favorites = db.execute(stmt).scalars().all()
+
+        next_cursor = None
+        if db_favorites and len(db_favorites) == limit:
+            next_cursor = pagination.encode_cursor(
+                'favorites', None, db_favorites[-1].id)
+
+        return {"favorites": db_favorites, "next_cursor": next_cursor}
+    except pagination.InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load favorites.")
 
 
 @products.get("/recents", response_model=RecentsOut)
-def read_recents(current_user = Depends(auth.get_current_user)):
-    return current_user
+def read_recents(cursor: Optional[str] = None, limit: Optional[int] = None,
+        db: Session = Depends(get_db),
+        current_user_id = Depends(auth.get_current_user_id)):
+    try:
+        stmt = (
+            select(Product, recents.c.created_at)
+            .join(recents, recents.c.product_id == Product.id)
+            .where(recents.c.user_id == current_user_id)
+            .options(joinedload(Product.store))
+            .order_by(recents.c.created_at.desc(), Product.id.desc())
+            .limit(limit)
+        )
+
+        if cursor is not None:
+            created_at, cursor_id = pagination.decode_cursor(
+                cursor, 'recents', pagination.timestamp)
+            stmt = stmt.where(
+                tuple_(recents.c.created_at, Product.id)
+                < tuple_(created_at, cursor_id)
+            )
+
+        db_recents = db.execute(stmt).all()
+
+        next_cursor = None
+        if db_recents and len(db_recents) == limit:
+            last_product, last_created_at = db_recents[-1]
+            next_cursor = pagination.encode_cursor(
+                'recents', last_created_at.isoformat(), last_product.id)
+
+        return {
+            "recents": [product for product, _ in db_recents],
+            "next_cursor": next_cursor
+        }
+    except pagination.InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load recents.")
 
 
 class ProductAlreadyInFavorites(Exception):
     pass
 
 
-def get_favorite(db: Session, user_id: int, product_id: int):
-    db_favorite = db.execute(
-        favorites.select()
-            .where(favorites.c.user_id == user_id)
-            .where(favorites.c.product_id == product_id)
-    ).first()
-
-    return db_favorite
+# The ProductOutSimple of :product_id, selected in the same statement as a
+# write to the `written` CTE, which yields a row per row it wrote.
+PRODUCT_OUT_WRITTEN_SQL = """
+    SELECT (SELECT count(*) FROM written) AS written,
+        p.id, p.name, p.description, p.image_url, p.calories, p.price,
+        s.id AS store_id, s.name AS store_name, s.logo_url, s.location,
+        s.lat, s.lng
+    FROM products AS p
+    JOIN stores AS s ON s.id = p.store_id
+    WHERE p.id = :product_id
+"""
+
+
+def product_out_simple(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "image_url": row.image_url,
+        "calories": row.calories,
+        "price": row.price,
+        "store": {
+            "id": row.store_id,
+            "name": row.store_name,
+            "logo_url": row.logo_url,
+            "location": row.location,
+            "lat": row.lat,
+            "lng": row.lng
+        }
+    }
 
 
 def insert_favorite(db: Session, user_id: int, product_id: int):
-    db.execute(
-        favorites.insert().values(user_id=user_id, product_id=product_id)
-    )
+    db_favorite = db.execute(text(f"""
+        WITH written AS (
+            INSERT INTO favorites (user_id, product_id)
+            SELECT :user_id, id FROM products WHERE id = :product_id
+            ON CONFLICT DO NOTHING
+            RETURNING product_id
+        )
+        {PRODUCT_OUT_WRITTEN_SQL}
+    """), {"user_id": user_id, "product_id": product_id}).first()
     db.commit()
 
+    return db_favorite
+
 
 @products.post("/favorites", response_model=ProductOutSimple, status_code=201)
 def create_favorite(body: FavoritesCreate, db: Session = Depends(get_db),
-        current_user = Depends(auth.get_current_user)):
+        current_user_id = Depends(auth.get_current_user_id)):
     try:
-        db_favorite = get_favorite(db, current_user.id, body.product_id)
-        if db_favorite:
+        db_favorite = insert_favorite(db, current_user_id, body.product_id)
+        if not db_favorite:
+            raise ProductDoesNotExist("Product not found.")
+
+        if not db_favorite.written:
             raise ProductAlreadyInFavorites("Product already in favorites.")
 
-        insert_favorite(db, current_user.id, body.product_id)
-        return get_product_by_id(db, body.product_id)
+        return product_out_simple(db_favorite)
+    except ProductDoesNotExist as error:
+        raise HTTPException(status_code=404, detail=str(error))
     except ProductAlreadyInFavorites as error:
         raise HTTPException(status_code=409, detail=str(error))
     except Exception:
@@ -99,23 +290,25 @@ class ProductNotInFavorites(Exception):
 
 
 def del_favorite(db: Session, user_id: int, product_id: int):
-    db.execute(
+    db_favorite = db.execute(
         favorites.delete()
             .where(favorites.c.user_id == user_id)
             .where(favorites.c.product_id == product_id)
-    )
+            .returning(favorites.c.product_id)
+    ).first()
     db.commit()
 
+    return db_favorite
+
 
 @products.delete("/favorites/{product_id}", status_code=204)
 def delete_favorite(product_id: int, db: Session = Depends(get_db),
-        current_user = Depends(auth.get_current_user)):
+        current_user_id = Depends(auth.get_current_user_id)):
     try:
-        db_favorite = get_favorite(db, current_user.id, product_id)
+        db_favorite = del_favorite(db, current_user_id, product_id)
         if not db_favorite:
             raise ProductNotInFavorites("Product not in favorites.")
 
-        del_favorite(db, current_user.id, product_id)
         return Response(status_code=204)
     except ProductNotInFavorites as error:
         raise HTTPException(status_code=409, detail=str(error))
@@ -123,136 +316,388 @@ def delete_favorite(product_id: int, db: Session = Depends(get_db),
         raise HTTPException(status_code=500, detail="Failed to delete favorite.")
 
 
-def get_recent(db: Session, user_id: int, product_id: int):
-    db_recent = db.execute(
-        recents.select()
-            .where(recents.c.user_id == user_id)
-            .where(recents.c.product_id == product_id)
-    ).first()
-
-    return db_recent
-
-
-def insert_recent(db: Session, user_id: int, product_id: int):
-    db.execute(
-        recents.insert().values(user_id=user_id, product_id=product_id)
+def get_product_simple_by_id(db: Session, product_id: int):
+    return (
+        db.query(Product)
+            .options(joinedload(Product.store))
+            .filter(Product.id == product_id)
+            .first()
     )
-    db.commit()
 
 
-def upd_recent(db: Session, user_id: int, product_id: int):
-    db.execute(
-        recents.update()
-            .where(recents.c.user_id == user_id)
-            .where(recents.c.product_id == product_id)
-            .values(created_at=datetime.utcnow())
-    )
+def upsert_recent(db: Session, user_id: int, product_id: int):
+    db_recent = db.execute(text(f"""
+        WITH written AS (
+            INSERT INTO recents (user_id, product_id)
+            SELECT :user_id, id FROM products WHERE id = :product_id
+            ON CONFLICT (user_id, product_id)
+                DO UPDATE SET created_at = now()
+            RETURNING product_id
+        )
+        {PRODUCT_OUT_WRITTEN_SQL}
+    """), {"user_id": user_id, "product_id": product_id}).first()
     db.commit()
 
+    return db_recent
+
 
 @products.post("/recents", response_model=ProductOutSimple, status_code=201)
 def create_recent(body: RecentsCreate, db: Session = Depends(get_db),
-        current_user = Depends(auth.get_current_user)):
+        current_user_id = Depends(auth.get_current_user_id)):
     try:
-        db_recent = get_recent(db, current_user.id, body.product_id)
-
+        # The view is written later in a batch, and the product read from the
+        # product cache when it holds it
+        if settings.recents_write_behind_enabled:
+            cached = product_cache.get(body.product_id)
+            product = cached[0] if cached else get_product_simple_by_id(
+                db, product_id=body.product_id)
+            if not product:
+                raise ProductDoesNotExist("Product not found.")
+
+            recents_buffer.buffer.add(current_user_id, body.product_id)
+            return product
+
+        db_recent = upsert_recent(db, current_user_id, body.product_id)
         if not db_recent:
-            insert_recent(db, current_user.id, body.product_id)
-        else:
-            upd_recent(db, current_user.id, body.product_id)
+            raise ProductDoesNotExist("Product not found.")
 
-        return get_product_by_id(db, body.product_id)
+        return product_out_simple(db_recent)
+    except ProductDoesNotExist as error:
+        raise HTTPException(status_code=404, detail=str(error))
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to create recent.")
 
 
+def filters_shape(filters: Filters):
+    """What of `filters` decides the text of the statements filtering by it."""
+    return (
+        filters.max_dist is not None,
+        tuple(column for column, _, _ in filters.ranges()),
+        filters.categories_match if filters.categories is not None else None
+    )
+
+
+def filters_params(filters: Filters):
+    params = dict(filters)
+    if filters.categories is not None:
+        params["categories_mask"] = categories_mask(filters.categories)
+    return params
+
+
+def where_filters(stmt, filters: Filters):
+    """Adds the Filters ranges and categories to `stmt`, a select from product_search."""
+    for column, min_field, max_field in filters.ranges():
+        stmt = stmt.where(text(
+            f'({column} BETWEEN :{min_field} AND :{max_field})'))
+
+    if filters.categories is not None:
+        if filters.categories_match == 'all':
+            stmt = stmt.where(text(
+                '(tag_mask & :categories_mask) = :categories_mask'))
+        else:
+            stmt = stmt.where(text('(tag_mask & :categories_mask) <> 0'))
+
+    return stmt
+
+
+def near_stores_params(filters: Filters):
+    """
+    The stores within filters.max_dist as resolved by the store index, as the
+    bind parameters of store_index.NEAR_STORES_SQL. None when the index is
+    disabled, not loaded or there is no radius.
+    """
+    index = store_index.get() if settings.store_index_enabled else None
+    if index is None or filters.max_dist is None:
+        return None
+
+    store_ids, distances = index.within(
+        filters.lat, filters.lng, filters.max_dist)
+    return {"store_ids": store_ids.tolist(), "distances": distances.tolist()}
+
+
+def near_products_sql(use_index: bool, filters: Filters):
+    """
+    The product_search rows, as `ps`, with their distance from (:x, :y, :z),
+    within the radius if there is one.
+    """
+    if use_index:
+        return f"""
+            (SELECT ps.*, d.distance
+                FROM product_search AS ps
+                JOIN {store_index.NEAR_STORES_SQL} ON d.store_id = ps.store_id
+            ) AS ps
+        """
+
+    within_radius = ''
+    if filters.max_dist is not None:
+        within_radius = f'WHERE {geo.WITHIN_RADIUS_SQL}'
+
+    return f"""
+        (SELECT *, {geo.DISTANCE_SQL} AS distance
+            FROM product_search AS s
+            {within_radius}
+        ) AS ps
+    """
+
+
+def product_out_filter(row):
+    return {
+        "id": row.product_id,
+        "name": row.name,
+        "description": row.description,
+        "price": row.price,
+        "calories": row.calories,
+        "image_url": row.image_url,
+        "distance": row.distance,
+        "store": {
+            "id": row.store_id,
+            "name": row.store_name,
+            "logo_url": row.logo_url
+        }
+    }
+
+
+def get_filter_candidates(db: Session, filters: Filters):
+    """
+    The products that could match `filters` from anywhere in the geohash cell
+    of (filters.lat, filters.lng), cached per cell. None when there are too
+    many of them to cache.
+    """
+    key, (lat, lng, radius) = filter_cache.cell(filters)
+    candidates = filter_cache.results.get(key, filter_cache.MISSING)
+    if candidates is not filter_cache.MISSING:
+        return candidates
+
+    def build():
+        s = product_search.alias('s')
+        stmt = select(s)
+        if radius is not None:
+            stmt = stmt.where(text(geo.WITHIN_RADIUS_SQL))
+        stmt = where_filters(stmt, filters)
+        return stmt.limit(bindparam('limit'))
+
+    params = {
+        **filters_params(filters),
+        **geo.query_params(lat, lng, radius),
+        "limit": settings.filter_cache_max_candidates + 1
+    }
+    rows = statements.filter_statements.execute(
+        db, ('candidates', filters_shape(filters)), build, params).fetchall()
+
+    candidates = None
+    if len(rows) <= settings.filter_cache_max_candidates:
+        candidates = catalog.Catalog(0, rows)
+
+    filter_cache.results.set(key, candidates)
+    return candidates
+
+
 @products.post("/filter", response_model=FilterOut)
-def filter_products(filters: Filters, skip: int = 0, 
-        limit: int = 100, db: Session = Depends(get_db)):
+def filter_products(filters: Filters, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, facets: bool = False,
+        accept: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-        stmt = (
-            select(text("""
-                p.id, p.name, description, price, calories, image_url, 
-                distance, s.id, s.name, logo_url
-            """))
-            .select_from(text("""
-                (SELECT *,
-                    (
-                        (
-                            (
-                                acos(
-                                    sin((:lat * pi() / 180))
-                                    *
-                                    sin((s.lat * pi() / 180))
-                                    +
-                                    cos((:lat * pi() / 180))
-                                    *
-                                    cos((s.lat * pi() / 180))
-                                    *
-                                    cos(((:lng - s.lng) * pi() / 180))
-                                )
-                            ) * 180 / pi()
-                        ) * 60 * 1.1515 * 1.609344
-                    ) AS distance FROM stores AS s
-                ) AS s
-            """))
-            .select_from(text('products AS p'))
-            .select_from(text('product_details AS pd'))
-            .where(text('s.id = p.store_id'))
-            .where(text('p.id = pd.product_id'))
-        )
+        # Streamed rows come straight from a server-side cursor, so memory
+        # does not grow with the limit.
+        stream = ndjson.requested(accept)
+
+        if settings.catalog_engine_enabled and not stream:
+            snapshot = catalog.get()
+            if snapshot is not None:
+                return snapshot.filter(filters, skip, limit, cursor, facets)
+
+        # The cached candidates are re-ranked for the exact location
+        if settings.filter_cache_enabled and not stream:
+            candidates = get_filter_candidates(db, filters)
+            if candidates is not None:
+                return candidates.filter(filters, skip, limit, cursor, facets)
+
+        params = {
+            **filters_params(filters),
+            **geo.query_params(filters.lat, filters.lng, filters.max_dist),
+            "limit": limit,
+            "skip": skip
+        }
+
+        near_stores = near_stores_params(filters)
+        if near_stores is not None:
+            if not near_stores["store_ids"]:
+                if stream:
+                    return ndjson.empty()
+                if facets:
+                    return {"products": [], "facets": facet_counts.empty()}
+                return {"products": []}
+            params.update(near_stores)
+
+        # The product id breaks ties, so every row has a distinct position to
+        # resume the listing from.
+        sort_by, ordering = 'product_id', 'ASC'
+        if filters.sort_by is not None and filters.ordering is not None:
+            sort_by, ordering = filters.sort_by, filters.ordering
+        sort = f'{sort_by} {ordering}'
+
+        if cursor is not None:
+            params["cursor_key"], params["cursor_id"] = \
+                pagination.decode_cursor(cursor, sort)
+            params["skip"] = 0
+
+        near_products = near_products_sql(near_stores is not None, filters)
+
+        def build():
+            stmt = (
+                select(text(f"""
+                    product_id, name, description, price, calories, image_url,
+                    distance, store_id, store_name, logo_url, {sort_by} AS sort_key
+                """))
+                .select_from(text(near_products))
+            )
 
-        if filters.max_dist is not None:
-            stmt = stmt.where(text('distance <= :max_dist'))
+            stmt = where_filters(stmt, filters)
 
-        if filters.min_price is not None and filters.max_price is not None:
-            stmt = stmt.where(text('(price BETWEEN :min_price AND :max_price)'))
+            if cursor is not None:
+                comparison = '>' if ordering == 'ASC' else '<'
+                stmt = stmt.where(text(
+                    f'({sort_by}, product_id) {comparison} (:cursor_key, :cursor_id)'))
 
-        if filters.min_calories is not None and filters.max_calories is not None:
-            stmt = stmt.where(text('(calories BETWEEN :min_calories AND :max_calories)'))
+            stmt = stmt.order_by(text(f'{sort}, product_id {ordering}'))
+            return stmt.limit(bindparam('limit')).offset(bindparam('skip'))
 
-        if filters.min_protein is not None and filters.max_protein is not None:
-            stmt = stmt.where(text('(protein BETWEEN :min_protein AND :max_protein)'))
+        shape = (
+            'filter', near_stores is not None, filters_shape(filters),
+            sort, cursor is not None
+        )
 
-        if filters.min_carbs is not None and filters.max_carbs is not None:
-            stmt = stmt.where(text('(carbohydrates BETWEEN :min_carbs AND :max_carbs)'))
+        if stream:
+            def cursor_after(last):
+                return pagination.encode_cursor(
+                    sort, last.sort_key, last.product_id)
+
+            return ndjson.response(
+                statements.filter_statements.execute(
+                    db, shape, build, params, stream=True),
+                product_out_filter, limit, cursor_after)
+
+        db_products = statements.filter_statements.execute(
+            db, shape, build, params).fetchall()
+
+        next_cursor = None
+        if db_products and len(db_products) == limit:
+            last = db_products[-1]
+            next_cursor = pagination.encode_cursor(
+                sort, last.sort_key, last.product_id)
+
+        response = {
+            "products": [product_out_filter(row) for row in db_products],
+            "next_cursor": next_cursor
+        }
+
+        # A single grouped pass over every matching product, whichever page
+        # is requested
+        if facets:
+            def build_facets():
+                stmt = (
+                    select(text(facet_counts.COLUMNS_SQL))
+                    .select_from(text(near_products))
+                )
+                stmt = where_filters(stmt, filters)
+                return stmt.group_by(text(facet_counts.GROUP_BY_SQL))
+
+            shape = ('facets', near_stores is not None, filters_shape(filters))
+            response["facets"] = facet_counts.from_rows(
+                statements.filter_statements.execute(
+                    db, shape, build_facets, params).fetchall())
+
+        return response
+    except pagination.InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to filter products.")
 
-        if filters.min_fat is not None and filters.max_fat is not None:
-            stmt = stmt.where(text('(fat BETWEEN :min_fat AND :max_fat)'))
 
-        if filters.categories is not None:
-            stmt = (stmt.select_from(text('product_tag AS pt'))
-                        .select_from(text('tags AS t'))
-                        .where(text('p.id = pt.product_id'))
-                        .where(text('pt.tag_id = t.id'))
-                        .where(text('label IN :categories'))
+@products.post("/products/search", response_model=FilterOut)
+def search_products(q: str, filters: Filters, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, accept: Optional[str] = Header(None),
+        db: Session = Depends(get_db)):
+    try:
+        stream = ndjson.requested(accept)
+
+        params = {
+            **filters_params(filters),
+            **geo.query_params(filters.lat, filters.lng, filters.max_dist),
+            "q": q,
+            "limit": limit,
+            "skip": skip
+        }
+
+        near_stores = near_stores_params(filters)
+        if near_stores is not None:
+            if not near_stores["store_ids"]:
+                return ndjson.empty() if stream else {"products": []}
+            params.update(near_stores)
+
+        if cursor is not None:
+            params["cursor_key"], params["cursor_id"] = \
+                pagination.decode_cursor(cursor, 'rank')
+            params["skip"] = 0
+
+        def build():
+            near_products = near_products_sql(near_stores is not None, filters)
+            stmt = (
+                select(text("""
+                    product_id, name, description, price, calories, image_url,
+                    distance, store_id, store_name, logo_url,
+                    CAST(ts_rank(search_vector, query) AS float8) AS rank
+                """))
+                .select_from(text(f"""
+                    {near_products}
+                    JOIN (SELECT id, search_vector FROM products) AS p
+                        ON p.id = product_id
+                    CROSS JOIN websearch_to_tsquery('english', :q) AS query
+                """))
+                .where(text('search_vector @@ query'))
             )
 
-        if filters.sort_by is not None and filters.ordering is not None:
-            stmt = stmt.order_by(text(f'{filters.sort_by} {filters.ordering}'))
-
-        stmt = stmt.limit(limit).offset(skip)
-
-        db_products = db.execute(stmt, dict(filters)).fetchall()
-        distinct_db_products = list(dict.fromkeys(db_products)) # Preserves order
-
-        response = []
-        for p_id, p_name, description, price, calories, image_url, \
-                distance, s_id, s_name, logo_url in distinct_db_products:
-            response.append({
-                "id": p_id,
-                "name": p_name,
-                "description": description,
-                "price": price,
-                "calories": calories,
-                "image_url": image_url,
-                "distance": distance,
-                "store": {
-                    "id": s_id,
-                    "name": s_name,
-                    "logo_url": logo_url
-                }
-            })
-        return {"products": response}
+            stmt = where_filters(stmt, filters)
+
+            # ts_rank is a real, which a float literal for the cursor key
+            # would not compare equal to, so both sides are float8
+            if cursor is not None:
+                stmt = stmt.where(text(
+                    '(CAST(ts_rank(search_vector, query) AS float8), product_id)'
+                    ' < (CAST(:cursor_key AS float8), :cursor_id)'))
+
+            stmt = stmt.order_by(text('rank DESC, product_id DESC'))
+            return stmt.limit(bindparam('limit')).offset(bindparam('skip'))
+
+        shape = (
+            'search', near_stores is not None, filters_shape(filters),
+            cursor is not None
+        )
+
+        if stream:
+            def cursor_after(last):
+                return pagination.encode_cursor(
+                    'rank', last.rank, last.product_id)
+
+            return ndjson.response(
+                statements.filter_statements.execute(
+                    db, shape, build, params, stream=True),
+                product_out_filter, limit, cursor_after)
+
+        db_products = statements.filter_statements.execute(
+            db, shape, build, params).fetchall()
+
+        next_cursor = None
+        if db_products and len(db_products) == limit:
+            last = db_products[-1]
+            next_cursor = pagination.encode_cursor(
+                'rank', last.rank, last.product_id)
+
+        return {
+            "products": [product_out_filter(row) for row in db_products],
+            "next_cursor": next_cursor
+        }
+    except pagination.InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=str(error))
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to filter products.")
+        raise HTTPException(status_code=500, detail="Failed to search products.")
@@ -1,10 +1,13 @@
-import itertools
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, text
+import json
+import numpy as np
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.models import get_db
-from app.models.store import Store
-from app.schemas import StoreOut, SearchOut
+from app.schemas import StoreOut, StoresOut, SearchOut
+from app.utils import batch, conditional, geo, menu_cache, ndjson, pagination, store_index
+from app.utils.config import settings
 
 
 stores = APIRouter(
@@ -16,90 +19,292 @@ class StoreDoesNotExist(Exception):
     pass
 
 
-def get_store_by_id(db: Session, store_id: int):
-    return db.query(Store).filter(Store.id == store_id).first()
+# The stores with their menu, the products narrowed to the ProductOutStore
+# fields and grouped by category, as the StoreOut JSON, and their version.
+MENUS_SQL = """
+    SELECT s.id, CAST(json_build_object(
+        'id', s.id,
+        'name', s.name,
+        'logo_url', s.logo_url,
+        'location', s.location,
+        'lat', s.lat,
+        'lng', s.lng,
+        'products', COALESCE((
+            SELECT json_agg(json_build_object(
+                'category', c.category,
+                'products', c.products
+            ) ORDER BY c.category DESC)
+            FROM (SELECT p.category, json_agg(json_build_object(
+                        'id', p.id,
+                        'name', p.name,
+                        'description', p.description,
+                        'image_url', p.image_url,
+                        'calories', p.calories,
+                        'price', p.price
+                    ) ORDER BY p.id) AS products
+                FROM products AS p
+                WHERE p.store_id = s.id
+                GROUP BY p.category
+            ) AS c
+        ), '[]')
+    ) AS text) AS menu, s.version, s.updated_at
+    FROM stores AS s
+"""
+
+
+def get_store_menu(db: Session, store_id: int):
+    return db.execute(text(f"{MENUS_SQL} WHERE s.id = :id"),
+        {"id": store_id}).first()
+
+
+def get_store_menus(db: Session, store_ids: list[int]):
+    return db.execute(text(f"{MENUS_SQL} WHERE s.id = ANY(:ids)"),
+        {"ids": store_ids}).fetchall()
+
+
+def get_store_version(db: Session, store_id: int):
+    return db.execute(text("""
+        SELECT version, updated_at FROM stores WHERE id = :id
+    """), {"id": store_id}).first()
+
+
+@stores.get("/stores", response_model=StoresOut)
+def read_stores(ids: str, db: Session = Depends(get_db)):
+    try:
+        store_ids = batch.parse_ids(ids)
+
+        menus = {}
+        for store_id in store_ids:
+            cached = menu_cache.get(store_id)
+            if cached is not None:
+                menus[store_id] = cached[0]
+
+        uncached = [store_id for store_id in store_ids if store_id not in menus]
+        if uncached:
+            loaded_at = menu_cache.generation()
+            for db_menu in get_store_menus(db, uncached):
+                menu = db_menu.menu.encode()
+                menus[db_menu.id] = menu
+                menu_cache.set(db_menu.id, (
+                    menu, conditional.etag(db_menu.version), db_menu.updated_at
+                ), loaded_at)
+
+        # The menus are already StoreOut JSON, so they are joined as they are
+        found = [menus[store_id] for store_id in store_ids if store_id in menus]
+        missing = [store_id for store_id in store_ids if store_id not in menus]
+        content = b'{"stores":[' + b','.join(found) + b'],"missing":' \
+            + json.dumps(missing).encode() + b'}'
+        return Response(content=content, media_type="application/json")
+    except batch.InvalidIds as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to load stores.")
 
 
 @stores.get("/stores/{id}", response_model=StoreOut)
-def read_store(id: int, db: Session = Depends(get_db)):
+def read_store(id: int, if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        db: Session = Depends(get_db)):
     try:
-        db_store = get_store_by_id(db, store_id=id)
-        if not db_store:
+        cached = menu_cache.get(id)
+        if cached is not None:
+            menu, etag, last_modified = cached
+            if conditional.not_modified(if_none_match, if_modified_since,
+                    etag, last_modified):
+                return conditional.not_modified_response(etag, last_modified)
+
+            return Response(content=menu, media_type="application/json",
+                headers={**conditional.headers(etag, last_modified),
+                    "X-Cache": "HIT"})
+
+        # Revalidating only needs the store's version, not its menu
+        if if_none_match is not None or if_modified_since is not None:
+            db_version = get_store_version(db, store_id=id)
+            if db_version is not None:
+                etag = conditional.etag(db_version.version)
+                if conditional.not_modified(if_none_match, if_modified_since,
+                        etag, db_version.updated_at):
+                    return conditional.not_modified_response(
+                        etag, db_version.updated_at)
+
+        loaded_at = menu_cache.generation()
+        db_menu = get_store_menu(db, store_id=id)
+        if db_menu is None:
             raise StoreDoesNotExist("Store not found.")
 
-        products = []
-        for key, group in itertools.groupby(db_store.products,
-                lambda product: product.category):
-
-            category_products = []
-            for product in group:
-                category_products.append({
-                    "id": product.id,
-                    "name": product.name,
-                    "description": product.description,
-                    "image_url": product.image_url,
-                    "calories": product.calories,
-                    "price": product.price
-                })
-
-            products.append({
-                "category": key,
-                "products": category_products
-            })
-
-        return {
-            "id": db_store.id,
-            "name": db_store.name,
-            "logo_url": db_store.logo_url,
-            "location": db_store.location,
-            "lat": db_store.lat,
-            "lng": db_store.lng,
-            "products": products
-        }
+        # Already shaped as StoreOut by the query
+        menu = db_menu.menu.encode()
+        etag = conditional.etag(db_menu.version)
+        menu_cache.set(id, (menu, etag, db_menu.updated_at), loaded_at)
+        return Response(content=menu, media_type="application/json",
+            headers={**conditional.headers(etag, db_menu.updated_at),
+                "X-Cache": "MISS"})
     except StoreDoesNotExist as error:
         raise HTTPException(status_code=404, detail=str(error))
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to load store.")
 
 
+_trigram_search = None
+
+
+def trigram_search_enabled(db: Session):
+    """Whether pg_trgm is installed, and so the trigram index on stores.name."""
+    global _trigram_search
+
+    if _trigram_search is None:
+        _trigram_search = db.execute(text("""
+            SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+        """)).scalar()
+    return _trigram_search
+
+
+def ranked_search_stmt(nearby: str, with_cursor: bool):
+    """
+    Ranks the `nearby` stores whose name is similar to or contains the search
+    by their trigram similarity, discounted by their distance.
+    """
+    after_cursor = ''
+    if with_cursor:
+        after_cursor = 'WHERE (rank, id) < (:cursor_key, :cursor_id)'
+
+    return text(f"""
+        SELECT *
+        FROM (SELECT id, name, logo_url, location, distance,
+                similarity(name, :q) / (1 + distance) AS rank
+            FROM {nearby}
+            WHERE name % :q OR name ILIKE :q_like
+        ) AS ranked_stores
+        {after_cursor}
+        ORDER BY rank DESC, id DESC
+        LIMIT :limit OFFSET :skip
+    """)
+
+
+def store_out_search(row):
+    return {
+        "id": row.id,
+        "name": row.name,
+        "logo_url": row.logo_url,
+        "location": row.location,
+        "distance": row.distance
+    }
+
+
 @stores.get("/search", response_model=SearchOut)
 def search_stores(q: str, lat: float, lng: float, distance: float = 3,
-        skip: int = 0,  limit: int = 100, db: Session = Depends(get_db)):
+        skip: int = 0,  limit: int = 100, cursor: Optional[str] = None,
+        accept: Optional[str] = Header(None), db: Session = Depends(get_db)):
     try:
-        stmt = text("""
-            SELECT * 
-            FROM (SELECT id, name, logo_url, location, 
-                    (
-                        (
-                            (
-                                acos(
-                                    sin((:lat * pi() / 180))
-                                    *
-                                    sin((s.lat * pi() / 180))
-                                    +
-                                    cos((:lat * pi() / 180))
-                                    *
-                                    cos((s.lat * pi() / 180))
-                                    *
-                                    cos(((:lng - s.lng) * pi() / 180))
-                                )
-                            ) * 180 / pi()
-                        ) * 60 * 1.1515 * 1.609344
-                    ) AS distance FROM stores AS s
-            ) AS stores_with_dist
-            WHERE distance <= :distance AND name ILIKE :q
-            LIMIT :limit OFFSET :skip
-        """)
-
-        params = {
-            "q": f'%{q}%',
-            "lat": lat,
-            "lng": lng,
-            "distance": distance,
-            "limit": limit,
-            "skip": skip
-        }
+        stream = ndjson.requested(accept)
+        sort = 'rank' if trigram_search_enabled(db) else 'distance'
+
+        cursor_key = cursor_id = None
+        if cursor is not None:
+            cursor_key, cursor_id = pagination.decode_cursor(cursor, sort)
+            skip = 0
+
+        index = store_index.get() if settings.store_index_enabled else None
+        if index is not None and sort == 'rank':
+            store_ids, distances = index.within(lat, lng, distance)
+            if not len(store_ids):
+                return ndjson.empty() if stream else {"stores": []}
+
+            stmt = ranked_search_stmt(f"""
+                (SELECT s.id, s.name, s.logo_url, s.location, d.distance
+                    FROM stores AS s
+                    JOIN {store_index.NEAR_STORES_SQL} ON d.store_id = s.id
+                ) AS s
+            """, cursor is not None)
+            params = {
+                "q": q,
+                "q_like": f'%{q}%',
+                "limit": limit,
+                "skip": skip,
+                "cursor_key": cursor_key,
+                "cursor_id": cursor_id,
+                "store_ids": store_ids.tolist(),
+                "distances": distances.tolist()
+            }
+        elif index is not None:
+            store_ids, distances = index.within(lat, lng, distance, name=q)
+
+            # Pages in memory, so the query only loads the rows of the page.
+            order = np.lexsort((store_ids, distances))
+            store_ids, distances = store_ids[order], distances[order]
+            if cursor is not None:
+                after_cursor = (distances > cursor_key) | (
+                    (distances == cursor_key) & (store_ids > cursor_id))
+                skip = (int(np.argmax(after_cursor)) if after_cursor.any()
+                    else len(after_cursor))
+
+            store_ids = store_ids[skip:skip + limit]
+            distances = distances[skip:skip + limit]
+            if not len(store_ids):
+                return ndjson.empty() if stream else {"stores": []}
+
+            stmt = text(f"""
+                SELECT s.id, s.name, s.logo_url, s.location, d.distance
+                FROM stores AS s
+                JOIN {store_index.NEAR_STORES_SQL} ON d.store_id = s.id
+                ORDER BY d.distance, s.id
+            """)
+            params = {
+                "store_ids": store_ids.tolist(),
+                "distances": distances.tolist()
+            }
+        else:
+            nearby = f"""
+                (SELECT id, name, logo_url, location,
+                        {geo.DISTANCE_SQL} AS distance
+                    FROM stores AS s
+                    WHERE {geo.WITHIN_RADIUS_SQL}
+                ) AS s
+            """
+
+            if sort == 'rank':
+                stmt = ranked_search_stmt(nearby, cursor is not None)
+            else:
+                after_cursor = ''
+                if cursor is not None:
+                    after_cursor = 'AND (distance, id) > (:cursor_key, :cursor_id)'
+
+                stmt = text(f"""
+                    SELECT *
+                    FROM {nearby}
+                    WHERE name ILIKE :q_like {after_cursor}
+                    ORDER BY distance, id
+                    LIMIT :limit OFFSET :skip
+                """)
+
+            params = {
+                "q": q,
+                "q_like": f'%{q}%',
+                "limit": limit,
+                "skip": skip,
+                "cursor_key": cursor_key,
+                "cursor_id": cursor_id,
+                **geo.query_params(lat, lng, distance)
+            }
+
+        def cursor_after(last):
+            return pagination.encode_cursor(
+                sort, last.rank if sort == 'rank' else last.distance, last.id)
+
+        if stream:
+            return ndjson.response(
+                db.connection().execution_options(stream_results=True)
+                    .execute(stmt, params),
+                store_out_search, limit, cursor_after)
+
         near_stores = db.execute(stmt, params).fetchall()
-        return {"stores": near_stores}
+
+        next_cursor = None
+        if near_stores and len(near_stores) == limit:
+            next_cursor = cursor_after(near_stores[-1])
+
+        return {"stores": near_stores, "next_cursor": next_cursor}
+    except pagination.InvalidCursor as error:
+        raise HTTPException(status_code=400, detail=str(error))
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to search stores.")
@@ -1,38 +1,49 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from app.models import get_db
 from app.models.user import User
 from app.schemas import UserOut, UserCreate, Token
-from app.utils import auth
+from app.utils import auth, passwords
+from app.utils.config import settings
 
 
 users = APIRouter(
     tags=['Users']
 )
 
-myctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class InvalidCredentials(Exception):
     pass
 
 
+def hashing_unavailable(error: passwords.PoolSaturated):
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After":
+            str(settings.password_hashing_retry_after_seconds)})
+
+
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
 
+# Async, so waiting on the hashing pool holds no request thread; the
+# queries run on the threadpool.
 @users.post('/login', response_model=Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(),
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(),
         db: Session = Depends(get_db)):
     try:
         # OAuth2PasswordRequestForm's username corresponds to the email
-        db_user = get_user_by_email(db, user_credentials.username)
+        db_user = await run_in_threadpool(
+            get_user_by_email, db, user_credentials.username)
         if not db_user:
             raise InvalidCredentials("Incorrect username or password.")
 
-        if not myctx.verify(user_credentials.password, db_user.password):
+        if not await passwords.pool.verify(
+                user_credentials.password, db_user.password):
             raise InvalidCredentials("Incorrect username or password.")
 
         access_token = auth.create_access_token(data = {"user_id": db_user.id})
@@ -42,6 +53,8 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends(),
             status_code=401,
             detail=str(error),
             headers={"WWW-Authenticate": "Basic"})
+    except passwords.PoolSaturated as error:
+        raise hashing_unavailable(error)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to login")
 
@@ -50,8 +63,7 @@ class EmailAlreadyExists(Exception):
     pass
 
 
-def insert_user(db: Session, user: UserCreate):
-    hashed_password = myctx.hash(user.password)
+def insert_user(db: Session, user: UserCreate, hashed_password: str):
     db_user = User(
         first_name=user.first_name,
         last_name=user.last_name,
@@ -65,17 +77,21 @@ def insert_user(db: Session, user: UserCreate):
 
 
 @users.post('/signup', response_model=Token)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: Session = Depends(get_db)):
     try:
-        db_user = get_user_by_email(db, email=user.email)
+        db_user = await run_in_threadpool(get_user_by_email, db, user.email)
         if db_user:
             raise EmailAlreadyExists("Email already registered.")
 
-        new_user = insert_user(db=db, user=user)
+        hashed_password = await passwords.pool.hash(user.password)
+        new_user = await run_in_threadpool(
+            insert_user, db, user, hashed_password)
         access_token = auth.create_access_token(data = {"user_id": new_user.id})
         return {"access_token": access_token, "token_type": "bearer"}
     except EmailAlreadyExists as error:
         raise HTTPException(status_code=409, detail=str(error))
+    except passwords.PoolSaturated as error:
+        raise hashing_unavailable(error)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to signup")
 
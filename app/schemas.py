@@ -1,6 +1,7 @@
 from typing import Optional
 from pydantic import BaseModel, validator
 from email_validator import validate_email
+from app.models.tag import CATEGORIES
 
 
 class Token(BaseModel):
@@ -108,6 +109,11 @@ class StoreOut(StoreBase):
         orm_mode = True
 
 
+class StoresOut(BaseModel):
+    stores: list[StoreOut]
+    missing: list[int] = []
+
+
 class StoreOutProduct(StoreBase):
     id: int
 
@@ -137,11 +143,22 @@ class StoreOutSearch(BaseModel):
 
 class SearchOut(BaseModel):
     stores: list[StoreOutSearch]
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
 
 
+class CompletionOut(BaseModel):
+    type: str
+    id: int
+    text: str
+
+
+class AutocompleteOut(BaseModel):
+    completions: list[CompletionOut]
+
+
 class ProductOutSimple(ProductBase):
     id: int
     store: StoreOutProduct
@@ -159,6 +176,11 @@ class ProductOutDetailed(ProductBase):
         orm_mode = True
 
 
+class ProductsOut(BaseModel):
+    products: list[ProductOutDetailed]
+    missing: list[int] = []
+
+
 class ProductOutFilter(ProductBase):
     id: int
     distance: float
@@ -168,8 +190,22 @@ class ProductOutFilter(ProductBase):
         orm_mode = True
 
 
+class FacetBucket(BaseModel):
+    min: float
+    max: float
+    count: int
+
+
+class Facets(BaseModel):
+    total: int
+    categories: dict[str, int]
+    histograms: dict[str, list[FacetBucket]]
+
+
 class FilterOut(BaseModel):
     products: list[ProductOutFilter]
+    next_cursor: Optional[str] = None
+    facets: Optional[Facets] = None
 
     class Config:
         orm_mode = True
@@ -177,6 +213,7 @@ class FilterOut(BaseModel):
 
 class FavoritesOut(BaseModel):
     favorites: list[ProductOutSimple]
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -188,6 +225,7 @@ class FavoritesCreate(BaseModel):
 
 class RecentsOut(BaseModel):
     recents: list[ProductOutSimple]
+    next_cursor: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -201,6 +239,7 @@ class Filters(BaseModel):
     lat: float
     lng: float
     categories: Optional[tuple[str, ...]] = None
+    categories_match: str = 'any'
     max_dist: Optional[float] = None
     min_price: Optional[float] = None
     max_price: Optional[float] = None
@@ -217,16 +256,19 @@ class Filters(BaseModel):
 
     @validator('categories')
     def categories_validation(cls, categories):
-        valid_categories = [
-            'Vegan', 'Vegeterian', 'Sugar Free',
-            'Gluten Free', 'Lactose Free', 'Pescatarian'
-        ]
-
         for categ in categories:
-            if categ not in valid_categories:
+            if categ not in CATEGORIES:
                 raise ValueError('Invalid categories')
         return categories
 
+    @validator('categories_match')
+    def categories_match_validation(cls, categories_match):
+        valid_categories_match = ['any', 'all']
+
+        if categories_match not in valid_categories_match:
+            raise ValueError('Invalid categories_match')
+        return categories_match
+
     @validator('sort_by')
     def sort_by_validation(cls, sort_by):
         valid_sort_by = ['price', 'distance', 'calories', 'protein']
@@ -242,3 +284,19 @@ class Filters(BaseModel):
         if ordering not in valid_orderings:
             raise ValueError('Invalid ordering')
         return ordering
+
+    def ranges(self):
+        """The (column, min field, max field) of every range with both bounds set."""
+        ranges = (
+            ("price", "min_price", "max_price"),
+            ("calories", "min_calories", "max_calories"),
+            ("protein", "min_protein", "max_protein"),
+            ("carbohydrates", "min_carbs", "max_carbs"),
+            ("fat", "min_fat", "max_fat")
+        )
+        return [
+            (column, min_field, max_field)
+            for column, min_field, max_field in ranges
+            if getattr(self, min_field) is not None
+                and getattr(self, max_field) is not None
+        ]
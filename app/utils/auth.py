@@ -2,10 +2,16 @@ from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
+import hashlib
+import time
 from datetime import datetime, timedelta
+from collections import namedtuple
 from app.models import get_db
 from app.models.user import User
+from app.models.events import on_commit
+from .cache import LRUCache
 from .config import settings
+from . import stats
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -27,14 +33,30 @@ class InvalidUserID(Exception):
     pass
 
 
+# The user ids of recently verified tokens, keyed by the tokens' digest
+verified_tokens = LRUCache(maxsize=settings.token_cache_size)
+
+stats.register("token_cache", verified_tokens.stats)
+
+
 def verify_access_token(token: str):
     try:
+        digest = hashlib.sha256(token.encode()).digest()
+        user_id = verified_tokens.get(digest)
+        if user_id is not None:
+            return user_id
+
         payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
 
         user_id = payload.get("user_id")
         if user_id is None:
             raise InvalidUserID()
 
+        # Cached only until the token expires, when decoding would reject it
+        expires_at = payload.get("exp")
+        if expires_at is not None and expires_at > time.time():
+            verified_tokens.set(digest, user_id, ttl=expires_at - time.time())
+
         return user_id
     except (InvalidUserID, JWTError):
         raise HTTPException(
@@ -44,8 +66,57 @@ def verify_access_token(token: str):
         )
 
 
+# The authenticated user, narrowed to the fields of UserOut
+Principal = namedtuple(
+    "Principal", ["id", "first_name", "last_name", "email"])
+
+principals = LRUCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl_seconds
+)
+
+stats.register("principal_cache", principals.stats)
+
+
 def get_current_user(token: str = Depends(oauth2_scheme),
         db: Session = Depends(get_db)):
     user_id = verify_access_token(token)
-    db_user = db.query(User).filter(User.id == user_id).first()
-    return db_user
+
+    principal = principals.get(user_id)
+    if principal is not None:
+        return principal
+
+    db_user = (
+        db.query(User.id, User.first_name, User.last_name, User.email)
+            .filter(User.id == user_id)
+            .first()
+    )
+    if db_user is None:
+        raise HTTPException(
+            status_code=401,
+            detail='Could not validate credentials',
+            headers={"WWW-Authenticate":"Bearer"}
+        )
+
+    principal = Principal(*db_user)
+    principals.set(user_id, principal)
+    return principal
+
+
+def get_current_user_id(token: str = Depends(oauth2_scheme),
+        db: Session = Depends(get_db)):
+    """
+    The id of the authenticated user. With auth_trust_token_claims it is
+    taken from the verified token alone, so the token of a deleted user is
+    accepted until it expires.
+    """
+    if settings.auth_trust_token_claims:
+        return verify_access_token(token)
+
+    return get_current_user(token, db).id
+
+
+@on_commit(User)
+def invalidate_principals(changes):
+    for change in changes:
+        principals.pop(change.values["id"])
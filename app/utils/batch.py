@@ -0,0 +1,26 @@
+from .config import settings
+
+
+class InvalidIds(Exception):
+    pass
+
+
+def parse_ids(ids: str):
+    """
+    The distinct ids of a comma separated `ids` query parameter, in the
+    order requested.
+    """
+    try:
+        parsed = list(dict.fromkeys(
+            int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise InvalidIds("Invalid ids.")
+
+    if not parsed:
+        raise InvalidIds("No ids requested.")
+
+    if len(parsed) > settings.batch_max_ids:
+        raise InvalidIds(
+            f"At most {settings.batch_max_ids} ids can be requested at once.")
+
+    return parsed
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe mapping holding at most `maxsize` entries, evicting the
+    least recently used first. Entries expire `ttl` seconds after being set,
+    or never if `ttl` is None.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        """Stores `value`, expiring after `ttl` seconds if given, else the cache's."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
+
+
+class GenerationGuardedCache(LRUCache):
+    """
+    An LRUCache whose every invalidation bumps a generation, so a value
+    loaded before a write committed is not cached after the write
+    invalidated it. Callers read generation() before loading a value and
+    pass it to set() as `loaded_at`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        super().__init__(maxsize, ttl)
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def set(self, key, value, loaded_at: int):
+        """Stores `value`, unless the cache was invalidated since `loaded_at`."""
+        with self._generation_lock:
+            if loaded_at == self._generation:
+                super().set(key, value)
+
+    def invalidate(self, keys=None):
+        """Drops the entries of `keys`, or every entry if None."""
+        with self._generation_lock:
+            self._generation += 1
+            if keys is None:
+                self.clear()
+                return
+            for key in keys:
+                self.pop(key)
@@ -0,0 +1,226 @@
+import threading
+import numpy as np
+from sqlalchemy import select
+from app.models import SessionLocal
+from app.models.product import Product
+from app.models.product_details import ProductDetails
+from app.models.product_search import product_search
+from app.models.store import Store
+from app.models.tag import Tag, categories_mask
+from app.models.events import on_commit
+from . import facet_counts, geo, pagination
+
+
+class Catalog:
+    """
+    The product_search rows as column arrays, answering /filter with
+    vectorized masks instead of a query.
+    """
+
+    def __init__(self, version: int, rows):
+        self.version = version
+
+        columns = dict(zip(product_search.c.keys(), zip(*rows))) if rows \
+            else {key: () for key in product_search.c.keys()}
+
+        self.product_id = np.array(columns["product_id"], dtype=np.int64)
+        self.name = np.array(columns["name"], dtype=object)
+        self.description = np.array(columns["description"], dtype=object)
+        self.image_url = np.array(columns["image_url"], dtype=object)
+        self.price = np.array(columns["price"], dtype=np.float64)
+        self.calories = np.array(columns["calories"], dtype=np.int64)
+        self.protein = np.array(columns["protein"], dtype=np.int64)
+        self.carbohydrates = np.array(columns["carbohydrates"], dtype=np.int64)
+        self.fat = np.array(columns["fat"], dtype=np.int64)
+        self.tag_mask = np.array(columns["tag_mask"], dtype=np.int64)
+        self.store_id = np.array(columns["store_id"], dtype=np.int64)
+        self.store_name = np.array(columns["store_name"], dtype=object)
+        self.logo_url = np.array(columns["logo_url"], dtype=object)
+        self.lat = np.array(columns["lat"], dtype=np.float64)
+        self.lng = np.array(columns["lng"], dtype=np.float64)
+        self.lat_rad = np.radians(self.lat)
+        self.lng_rad = np.radians(self.lng)
+        self.cos_lat = np.cos(self.lat_rad)
+
+    @classmethod
+    def load(cls, db, version: int):
+        return cls(version, db.execute(select(product_search)).fetchall())
+
+    def __len__(self):
+        return len(self.product_id)
+
+    def distances(self, rows, lat: float, lng: float):
+        """Haversine distances in km from (lat, lng) to the products at `rows`."""
+        lat_rad, lng_rad = np.radians(lat), np.radians(lng)
+        h = (
+            np.sin((self.lat_rad[rows] - lat_rad) / 2) ** 2
+            + np.cos(lat_rad) * self.cos_lat[rows]
+            * np.sin((self.lng_rad[rows] - lng_rad) / 2) ** 2
+        )
+        return 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+    def matching(self, filters):
+        """Returns the (rows, distances) of the products matching `filters`."""
+        rows = np.arange(len(self))
+
+        if filters.max_dist is not None:
+            min_lat, max_lat, min_lng, max_lng = geo.bounding_box(
+                filters.lat, filters.lng, filters.max_dist)
+            rows = rows[
+                (self.lat >= min_lat) & (self.lat <= max_lat)
+                & (self.lng >= min_lng) & (self.lng <= max_lng)
+            ]
+
+        for column, min_field, max_field in filters.ranges():
+            values = getattr(self, column)[rows]
+            rows = rows[
+                (values >= getattr(filters, min_field))
+                & (values <= getattr(filters, max_field))
+            ]
+
+        if filters.categories is not None:
+            mask = categories_mask(filters.categories)
+            tags = self.tag_mask[rows] & mask
+            rows = rows[tags == mask if filters.categories_match == 'all'
+                else tags != 0]
+
+        distances = self.distances(rows, filters.lat, filters.lng)
+        if filters.max_dist is not None:
+            near = distances <= filters.max_dist
+            rows, distances = rows[near], distances[near]
+
+        return rows, distances
+
+    def facets(self, rows):
+        """The facet counts and histograms of the products at `rows`."""
+        return facet_counts.from_arrays(self.tag_mask[rows], {
+            column: getattr(self, column)[rows]
+            for _, column, _ in facet_counts.HISTOGRAMS
+        })
+
+    def filter(self, filters, skip: int, limit: int, cursor: str = None,
+            facets: bool = False):
+        """Answers /filter, with the same ordering and cursors as the query."""
+        rows, distances = self.matching(filters)
+        # Over every matching product, whichever page is requested
+        matching_facets = self.facets(rows) if facets else None
+
+        sort_by, ordering = 'product_id', 'ASC'
+        if filters.sort_by is not None and filters.ordering is not None:
+            sort_by, ordering = filters.sort_by, filters.ordering
+        sort = f'{sort_by} {ordering}'
+
+        keys = distances if sort_by == 'distance' \
+            else getattr(self, sort_by)[rows].astype(np.float64)
+        ids = self.product_id[rows]
+
+        # Sorting descending is sorting the negated keys ascending
+        sign = 1 if ordering == 'ASC' else -1
+        keys, ids = sign * keys, sign * ids
+
+        if cursor is not None:
+            cursor_key, cursor_id = pagination.decode_cursor(cursor, sort)
+            cursor_key, cursor_id = sign * float(cursor_key), sign * cursor_id
+            after = (keys > cursor_key) | ((keys == cursor_key) & (ids > cursor_id))
+            rows, distances, keys, ids = \
+                rows[after], distances[after], keys[after], ids[after]
+            skip = 0
+
+        # Only the first skip + limit rows get sorted. Every row tied with the
+        # last of them is kept, so the ids still break ties.
+        k = skip + limit
+        candidates = np.arange(len(rows))
+        if k < len(rows):
+            kth_key = np.partition(keys, k - 1)[k - 1]
+            candidates = np.flatnonzero(keys <= kth_key)
+        order = candidates[np.lexsort((ids[candidates], keys[candidates]))]
+        page = order[skip:k]
+
+        response = []
+        for i in page:
+            row = rows[i]
+            response.append({
+                "id": int(self.product_id[row]),
+                "name": self.name[row],
+                "description": self.description[row],
+                "price": float(self.price[row]),
+                "calories": int(self.calories[row]),
+                "image_url": self.image_url[row],
+                "distance": float(distances[i]),
+                "store": {
+                    "id": int(self.store_id[row]),
+                    "name": self.store_name[row],
+                    "logo_url": self.logo_url[row]
+                }
+            })
+
+        next_cursor = None
+        if len(page) and len(page) == limit:
+            last = page[-1]
+            next_cursor = pagination.encode_cursor(
+                sort, float(sign * keys[last]), int(sign * ids[last]))
+
+        response = {"products": response, "next_cursor": next_cursor}
+        if facets:
+            response["facets"] = matching_facets
+        return response
+
+
+_catalog = None
+_version = 0
+_stale = True
+_reloading = False
+_lock = threading.Lock()
+_reloading_lock = threading.Lock()
+
+
+def reload():
+    """
+    Loads a new version of the catalog and swaps it in. Requests already
+    holding the previous version finish with it.
+    """
+    global _catalog, _version, _stale
+
+    with _lock:
+        _stale = False
+        try:
+            with SessionLocal() as db:
+                _catalog = Catalog.load(db, _version + 1)
+                _version += 1
+        except Exception:
+            _stale = True
+            raise
+
+
+def _reload_stale():
+    global _reloading
+
+    try:
+        reload()
+    except Exception as exc:
+        print(exc)
+    finally:
+        _reloading = False
+
+
+def get():
+    """
+    The current catalog. Once it is stale, a single reload starts in the
+    background, and requests keep the current version until it is swapped in.
+    """
+    global _reloading
+
+    if _stale:
+        with _reloading_lock:
+            start, _reloading = not _reloading, True
+        if start:
+            threading.Thread(
+                target=_reload_stale, name="catalog-reload", daemon=True
+            ).start()
+    return _catalog
+
+
+@on_commit(Product, ProductDetails, Store, Tag)
+def invalidate(changes):
+    global _stale
+    _stale = True
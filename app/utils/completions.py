@@ -0,0 +1,196 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict, namedtuple
+from sqlalchemy import text
+from app.models import SessionLocal
+from app.models.product import Product
+from app.models.store import Store
+from app.models.tag import Tag
+from app.models.events import on_commit
+from .config import settings
+
+
+# Store and product names weighted by how many times their products were
+# favorited, and tag labels by how many times their products were.
+WEIGHTS_SQL = {
+    "store": """
+        SELECT s.id, s.name, count(f.user_id) AS weight
+        FROM stores AS s
+        LEFT JOIN products AS p ON p.store_id = s.id
+        LEFT JOIN favorites AS f ON f.product_id = p.id
+        GROUP BY s.id
+    """,
+    "product": """
+        SELECT p.id, p.name, count(f.user_id) AS weight
+        FROM products AS p
+        LEFT JOIN favorites AS f ON f.product_id = p.id
+        GROUP BY p.id
+    """,
+    "tag": """
+        SELECT t.id, t.label AS name, count(f.user_id) AS weight
+        FROM tags AS t
+        LEFT JOIN product_tag AS pt ON pt.tag_id = t.id
+        LEFT JOIN favorites AS f ON f.product_id = pt.product_id
+        GROUP BY t.id
+    """
+}
+
+# The model and name column behind every type of completion
+SOURCES = {Store: ("store", "name"), Product: ("product", "name"), Tag: ("tag", "label")}
+
+# Prefixes up to this long match too many names to rank per keystroke, so
+# their top completions are ranked once, when the index is built.
+SHORT_PREFIX = 2
+
+WORD_START = re.compile(r"\w+")
+
+Completion = namedtuple("Completion", ["type", "id", "text", "weight"])
+
+
+def rank(completion: Completion):
+    """Sorts the most favorited completions first, then the shortest."""
+    return (-completion.weight, len(completion.text), completion.text)
+
+
+class Completions:
+    """
+    Every store name, product name and tag label, keyed by each of its words
+    onwards and casefolded, in a sorted list of (key, completion). The names
+    completing a prefix are those between bisect(prefix) and
+    bisect(prefix + U+10FFFF).
+    """
+
+    def __init__(self, completions):
+        self.completions = {(c.type, c.id): c for c in completions}
+
+        self._keyed = sorted(
+            (key, completion)
+            for completion in self.completions.values()
+            for key in self.keys(completion.text)
+        )
+
+        top = defaultdict(set)
+        for key, completion in self._keyed:
+            for prefix in self.short_prefixes(key):
+                top[prefix].add(completion)
+        self._top = {
+            prefix: heapq.nsmallest(
+                settings.autocomplete_max_limit, candidates, key=rank)
+            for prefix, candidates in top.items()
+        }
+
+    @classmethod
+    def load(cls, db):
+        return cls([
+            Completion(type, row.id, row.name, row.weight)
+            for type, sql in WEIGHTS_SQL.items()
+            for row in db.execute(text(sql))
+        ])
+
+    @staticmethod
+    def keys(name: str):
+        name = name.casefold()
+        return {name[word.start():] for word in WORD_START.finditer(name)}
+
+    @staticmethod
+    def short_prefixes(key: str):
+        return {key[:length] for length in range(SHORT_PREFIX + 1)}
+
+    def __len__(self):
+        return len(self.completions)
+
+    def _matching(self, prefix: str):
+        start = bisect.bisect_left(self._keyed, (prefix,))
+        stop = bisect.bisect_left(
+            self._keyed, (prefix + "\U0010ffff",), lo=start)
+        return {completion for _, completion in self._keyed[start:stop]}
+
+    def complete(self, prefix: str, limit: int):
+        """The `limit` top ranked completions of `prefix`."""
+        prefix = " ".join(prefix.casefold().split())
+        if len(prefix) <= SHORT_PREFIX:
+            return self._top.get(prefix, [])[:limit]
+
+        return heapq.nsmallest(limit, self._matching(prefix), key=rank)
+
+    def _add(self, completion: Completion):
+        self.completions[(completion.type, completion.id)] = completion
+        for key in self.keys(completion.text):
+            bisect.insort(self._keyed, (key, completion))
+            for prefix in self.short_prefixes(key):
+                self._top[prefix] = heapq.nsmallest(
+                    settings.autocomplete_max_limit,
+                    {*self._top.get(prefix, ()), completion},
+                    key=rank
+                )
+
+    def _remove(self, completion: Completion):
+        del self.completions[(completion.type, completion.id)]
+        keys = self.keys(completion.text)
+        for key in keys:
+            i = bisect.bisect_left(self._keyed, (key, completion))
+            if i < len(self._keyed) and self._keyed[i] == (key, completion):
+                del self._keyed[i]
+
+        # Only a top list the completion was in needs refilling
+        for prefix in set().union(*map(self.short_prefixes, keys)):
+            if completion in self._top.get(prefix, ()):
+                self._top[prefix] = heapq.nsmallest(
+                    settings.autocomplete_max_limit,
+                    self._matching(prefix),
+                    key=rank
+                )
+
+    def update(self, changes):
+        """
+        Applies the names written by `changes`, touching only their keys and
+        the top lists of their short prefixes. Renamed completions keep their
+        weight until the next rebuild.
+        """
+        for change in changes:
+            type, column = SOURCES[change.model]
+            id, name = change.values["id"], change.values[column]
+
+            previous = self.completions.get((type, id))
+            if change.deleted:
+                if previous is not None:
+                    self._remove(previous)
+            elif name is not None:
+                if previous is not None and previous.text == name:
+                    continue
+                if previous is not None:
+                    self._remove(previous)
+                weight = previous.weight if previous is not None else 0
+                self._add(Completion(type, id, name, weight))
+
+
+_completions = None
+_lock = threading.Lock()
+
+
+def rebuild():
+    """Rebuilds the index and its weights from the database."""
+    global _completions
+
+    with _lock:
+        with SessionLocal() as db:
+            _completions = Completions.load(db)
+
+
+def get():
+    """The current index, built first if it was not built yet."""
+    if _completions is None:
+        try:
+            rebuild()
+        except Exception as exc:
+            print(exc)
+    return _completions
+
+
+@on_commit(*SOURCES)
+def update(changes):
+    with _lock:
+        if _completions is not None:
+            _completions.update(changes)
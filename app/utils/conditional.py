@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Response
+
+
+def etag(*versions):
+    """A strong ETag for a response built from rows at `versions`."""
+    return '"{}"'.format("-".join(str(version) for version in versions))
+
+
+def http_date(moment: datetime):
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+        current_etag: str, last_modified: datetime):
+    """
+    Whether the client's copy is current. If-Modified-Since is only looked at
+    without If-None-Match, and at the second resolution of HTTP dates.
+    """
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(
+            tag.removeprefix("W/") == current_etag for tag in tags)
+
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+
+    return False
+
+
+def headers(current_etag: str, last_modified: datetime):
+    return {"ETag": current_etag, "Last-Modified": http_date(last_modified)}
+
+
+def not_modified_response(current_etag: str, last_modified: datetime):
+    return Response(status_code=304,
+        headers=headers(current_etag, last_modified))
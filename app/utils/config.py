@@ -10,6 +10,33 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int = 60
+    store_index_enabled: bool = True
+    store_index_refresh_seconds: int = 5 * 60
+    catalog_engine_enabled: bool = False
+    catalog_refresh_seconds: int = 5 * 60
+    filter_cache_enabled: bool = True
+    filter_cache_size: int = 1024
+    filter_cache_ttl_seconds: int = 60
+    filter_cache_geohash_precision: int = 6
+    filter_cache_max_candidates: int = 2000
+    prepared_statements_enabled: bool = True
+    autocomplete_refresh_seconds: int = 10 * 60
+    autocomplete_max_limit: int = 20
+    ndjson_batch_size: int = 500
+    menu_cache_size: int = 512
+    batch_max_ids: int = 200
+    product_cache_size: int = 2048
+    product_cache_ttl_seconds: int = 5 * 60
+    principal_cache_size: int = 4096
+    principal_cache_ttl_seconds: int = 5 * 60
+    auth_trust_token_claims: bool = False
+    token_cache_size: int = 8192
+    password_hashing_workers: int = 2
+    password_hashing_queue_limit: int = 16
+    password_hashing_retry_after_seconds: int = 1
+    recents_write_behind_enabled: bool = False
+    recents_flush_interval_ms: int = 500
+    recents_flush_max_entries: int = 1000
 
 
 settings = Settings()
@@ -0,0 +1,105 @@
+import numpy as np
+from app.models.tag import CATEGORIES
+
+
+# The (name, product_search column, bucket width) of every histogram
+HISTOGRAMS = (
+    ("price", "price", 1),
+    ("calories", "calories", 100),
+    ("protein", "protein", 5),
+    ("carbs", "carbohydrates", 10),
+    ("fat", "fat", 5)
+)
+
+BUCKETS_SQL = [
+    f"floor({column} / {width})" for _, column, width in HISTOGRAMS
+]
+
+# Selects, in one grouped pass over the matching products, a row with the
+# total and per category counts, and a row per bucket of each histogram.
+COLUMNS_SQL = ", ".join([
+    "count(*) AS total",
+    *(
+        f"count(*) FILTER (WHERE tag_mask & {1 << bit} <> 0) AS category_{bit}"
+        for bit in range(len(CATEGORIES))
+    ),
+    *(
+        f"{bucket} AS {name}_bucket"
+        for bucket, (name, _, _) in zip(BUCKETS_SQL, HISTOGRAMS)
+    ),
+    f"GROUPING({', '.join(BUCKETS_SQL)}) AS grouping_set"
+])
+
+GROUP_BY_SQL = "GROUPING SETS ((), {})".format(
+    ", ".join(f"({bucket})" for bucket in BUCKETS_SQL))
+
+
+def bucket_out(name: str, bucket, count):
+    width = next(width for histogram, _, width in HISTOGRAMS if histogram == name)
+    return {
+        "min": float(bucket) * width,
+        "max": (float(bucket) + 1) * width,
+        "count": int(count)
+    }
+
+
+def empty():
+    return {
+        "total": 0,
+        "categories": {category: 0 for category in CATEGORIES},
+        "histograms": {name: [] for name, _, _ in HISTOGRAMS}
+    }
+
+
+def from_rows(rows):
+    """The facets selected by COLUMNS_SQL grouped by GROUP_BY_SQL."""
+    facets = empty()
+    histograms = len(HISTOGRAMS)
+
+    for row in rows:
+        # A bit of GROUPING is set for every bucket the row is not grouped by
+        if row.grouping_set == (1 << histograms) - 1:
+            facets["total"] = row.total
+            facets["categories"] = {
+                category: getattr(row, f"category_{bit}")
+                for bit, category in enumerate(CATEGORIES)
+            }
+            continue
+
+        for i, (name, _, _) in enumerate(HISTOGRAMS):
+            if not row.grouping_set >> (histograms - 1 - i) & 1:
+                bucket = getattr(row, f"{name}_bucket")
+                if bucket is not None:
+                    facets["histograms"][name].append(
+                        bucket_out(name, bucket, row.total))
+
+    for buckets in facets["histograms"].values():
+        buckets.sort(key=lambda bucket: bucket["min"])
+
+    return facets
+
+
+def from_arrays(tag_masks, columns: dict):
+    """
+    The facets of the products with `tag_masks` and the product_search
+    `columns`, a dict of column name to array.
+    """
+    bits = np.arange(len(CATEGORIES))
+    counts = ((tag_masks[:, None] >> bits) & 1).sum(axis=0)
+
+    histograms = {}
+    for name, column, width in HISTOGRAMS:
+        buckets, bucket_counts = np.unique(
+            np.floor(columns[column] / width), return_counts=True)
+        histograms[name] = [
+            bucket_out(name, bucket, count)
+            for bucket, count in zip(buckets, bucket_counts)
+        ]
+
+    return {
+        "total": len(tag_masks),
+        "categories": {
+            category: int(count) for category, count in zip(CATEGORIES, counts)
+        },
+        "histograms": histograms
+    }
@@ -0,0 +1,53 @@
+from app.models.product import Product
+from app.models.product_details import ProductDetails
+from app.models.store import Store
+from app.models.tag import Tag
+from app.models.events import on_commit
+from .cache import LRUCache
+from .config import settings
+from . import geo, stats
+
+
+# Filters fields that decide which products are candidates. Location is
+# quantized to a geohash cell, and the sort only orders the candidates.
+CANDIDATE_FIELDS = ("max_dist", "categories_match")
+
+# Marks a miss, since None is cached for cells with too many candidates
+MISSING = object()
+
+results = LRUCache(
+    maxsize=settings.filter_cache_size,
+    ttl=settings.filter_cache_ttl_seconds
+)
+
+stats.register("filter_cache", results.stats)
+
+
+def cell(filters):
+    """
+    Returns the cache key of `filters` and the (lat, lng, radius) around
+    which to load candidates, so they hold every product matching `filters`
+    from anywhere in the geohash cell of (filters.lat, filters.lng).
+    """
+    cell_hash, lat, lng, cell_radius = geo.geohash_cell(
+        filters.lat, filters.lng, settings.filter_cache_geohash_precision)
+
+    key = [cell_hash]
+    key.extend(getattr(filters, field) for field in CANDIDATE_FIELDS)
+    key.extend(
+        (column, getattr(filters, min_field), getattr(filters, max_field))
+        for column, min_field, max_field in filters.ranges()
+    )
+    key.append(frozenset(filters.categories)
+        if filters.categories is not None else None)
+
+    radius = None
+    if filters.max_dist is not None:
+        radius = filters.max_dist + cell_radius
+
+    return tuple(key), (lat, lng, radius)
+
+
+@on_commit(Product, ProductDetails, Store, Tag)
+def invalidate(changes):
+    results.clear()
@@ -0,0 +1,137 @@
+import math
+
+
+# The distance queries convert degrees of arc to km through nautical miles
+# (60 nm per degree, 1.1515 mi per nm, 1.609344 km per mi).
+KM_PER_DEGREE = 60 * 1.1515 * 1.609344
+EARTH_RADIUS_KM = KM_PER_DEGREE * 180 / math.pi
+
+MIN_LAT, MAX_LAT = -90.0, 90.0
+MIN_LNG, MAX_LNG = -180.0, 180.0
+
+
+def bounding_box(lat: float, lng: float, radius: float):
+    """
+    Returns (min_lat, max_lat, min_lng, max_lng) in degrees, enclosing every
+    point within `radius` km of (lat, lng). Boxes that reach a pole or cross
+    the antimeridian span the whole longitude range.
+    """
+    angular_radius = radius / EARTH_RADIUS_KM
+    min_lat = math.radians(lat) - angular_radius
+    max_lat = math.radians(lat) + angular_radius
+
+    if min_lat <= -math.pi / 2 or max_lat >= math.pi / 2:
+        return (
+            max(math.degrees(min_lat), MIN_LAT),
+            min(math.degrees(max_lat), MAX_LAT),
+            MIN_LNG,
+            MAX_LNG
+        )
+
+    ratio = math.sin(angular_radius) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return math.degrees(min_lat), math.degrees(max_lat), MIN_LNG, MAX_LNG
+
+    delta_lng = math.degrees(math.asin(ratio))
+    min_lng = lng - delta_lng
+    max_lng = lng + delta_lng
+    if min_lng < MIN_LNG or max_lng > MAX_LNG:
+        min_lng, max_lng = MIN_LNG, MAX_LNG
+
+    return math.degrees(min_lat), math.degrees(max_lat), min_lng, max_lng
+
+
+def unit_vector(lat: float, lng: float):
+    """Returns the (x, y, z) point of (lat, lng) on the unit sphere."""
+    lat, lng = math.radians(lat), math.radians(lng)
+    return (
+        math.cos(lat) * math.cos(lng),
+        math.cos(lat) * math.sin(lng),
+        math.sin(lat)
+    )
+
+
+def distance(lat1: float, lng1: float, lat2: float, lng2: float):
+    """Haversine distance in km between (lat1, lng1) and (lat2, lng2)."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(h, 1)))
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_cell(lat: float, lng: float, precision: int):
+    """
+    Returns the geohash of (lat, lng) with `precision` characters, along with
+    the center of its cell and the distance in km from the center to the
+    cell's farthest corner.
+    """
+    lat_range, lng_range = [MIN_LAT, MAX_LAT], [MIN_LNG, MAX_LNG]
+    chars = []
+    bit = 0
+    char = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        char <<= 1
+        if value >= middle:
+            char |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[char])
+            bit = 0
+            char = 0
+
+    center_lat = (lat_range[0] + lat_range[1]) / 2
+    center_lng = (lng_range[0] + lng_range[1]) / 2
+    radius = max(
+        distance(center_lat, center_lng, corner_lat, lng_range[1])
+        for corner_lat in lat_range
+    )
+    return ''.join(chars), center_lat, center_lng, radius
+
+
+# Great-circle distance in km between the row `s` and (:x, :y, :z), `s` being
+# a store or a product_search row, which carries its store's coordinates.
+# The dot product is clamped because rounding can push it just past 1,
+# where acos is undefined.
+DISTANCE_SQL = """
+    acos(LEAST(1, GREATEST(-1, s.x * :x + s.y * :y + s.z * :z)))
+    * :earth_radius
+"""
+
+# The `s` rows within the radius of (:x, :y, :z). The bounding box can be
+# answered from the (lat, lng) index, the dot product needs no trigonometry.
+WITHIN_RADIUS_SQL = """
+    s.lat BETWEEN :min_lat AND :max_lat
+    AND s.lng BETWEEN :min_lng AND :max_lng
+    AND s.x * :x + s.y * :y + s.z * :z >= :min_dot
+"""
+
+
+def query_params(lat: float, lng: float, radius: float = None):
+    """Bind parameters for DISTANCE_SQL and, given a radius, WITHIN_RADIUS_SQL."""
+    x, y, z = unit_vector(lat, lng)
+    params = {"x": x, "y": y, "z": z, "earth_radius": EARTH_RADIUS_KM}
+
+    if radius is not None:
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius)
+        params.update({
+            "min_lat": min_lat,
+            "max_lat": max_lat,
+            "min_lng": min_lng,
+            "max_lng": max_lng,
+            "min_dot": math.cos(min(radius / EARTH_RADIUS_KM, math.pi))
+        })
+
+    return params
@@ -0,0 +1,37 @@
+from app.models.product import Product
+from app.models.store import Store
+from app.models.events import on_commit
+from .cache import GenerationGuardedCache
+from .config import settings
+from . import stats
+
+
+menus = GenerationGuardedCache(maxsize=settings.menu_cache_size)
+
+stats.register("menu_cache", menus.stats)
+
+
+def generation():
+    return menus.generation()
+
+
+def get(store_id: int):
+    """The (serialized menu, ETag, Last-Modified) of the store, or None."""
+    return menus.get(store_id)
+
+
+def set(store_id: int, menu: tuple, loaded_at: int):
+    """Caches `menu`, unless a write committed since `loaded_at` generation()."""
+    menus.set(store_id, menu, loaded_at)
+
+
+@on_commit(Store, Product)
+def invalidate(changes):
+    store_ids = []
+    for change in changes:
+        column = "id" if change.model is Store else "store_id"
+        for values in (change.values, change.previous):
+            store_id = values.get(column)
+            if store_id is not None:
+                store_ids.append(store_id)
+    menus.invalidate(store_ids)
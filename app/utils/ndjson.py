@@ -0,0 +1,51 @@
+import json
+from decimal import Decimal
+from typing import Optional
+from fastapi.responses import StreamingResponse
+from .config import settings
+
+
+MEDIA_TYPE = "application/x-ndjson"
+
+
+def requested(accept: Optional[str]):
+    """Whether the Accept header asks for newline delimited JSON."""
+    return accept is not None and MEDIA_TYPE in accept
+
+
+def encode(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def lines(result, serialize, limit: int, cursor_after):
+    """
+    Yields each row of `result` serialized as a line of JSON, fetching them
+    from the server-side cursor in batches, so only a batch is held at once.
+    A full page of `limit` rows ends with a {"next_cursor": ...} line, the
+    cursor_after(last_row) to resume from.
+    """
+    last, count = None, 0
+    try:
+        for rows in result.partitions(settings.ndjson_batch_size):
+            yield "".join(
+                json.dumps(serialize(row), default=encode) + "\n"
+                for row in rows
+            )
+            last, count = rows[-1], count + len(rows)
+    finally:
+        result.close()
+
+    if last is not None and count == limit:
+        yield json.dumps(
+            {"next_cursor": cursor_after(last)}, default=encode) + "\n"
+
+
+def response(result, serialize, limit: int, cursor_after):
+    return StreamingResponse(
+        lines(result, serialize, limit, cursor_after), media_type=MEDIA_TYPE)
+
+
+def empty():
+    return StreamingResponse(iter(()), media_type=MEDIA_TYPE)
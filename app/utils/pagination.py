@@ -0,0 +1,68 @@
+import base64
+import json
+import math
+from datetime import datetime
+from decimal import Decimal
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_key(key):
+    # A Numeric column's Decimal is kept a number, and round trips through
+    # float exactly for the short decimals stored
+    if isinstance(key, Decimal):
+        return float(key)
+    return str(key)
+
+
+def encode_cursor(sort: str, key, id: int):
+    """
+    Encodes the sort key and id of the last row of a page into an opaque
+    cursor, which resumes the listing right after that row.
+    """
+    payload = json.dumps([sort, key, id], default=encode_key)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def number(key):
+    if isinstance(key, bool) or not isinstance(key, (int, float)) \
+            or not math.isfinite(key):
+        raise TypeError("Cursor key is not a number.")
+    return key
+
+
+def timestamp(key):
+    return datetime.fromisoformat(key)
+
+
+def no_key(key):
+    if key is not None:
+        raise TypeError("Cursor has a key.")
+    return key
+
+
+def decode_cursor(cursor: str, sort: str, parse_key=number):
+    """
+    Returns the (key, id) encoded in `cursor`, which must have been issued
+    for a listing with the same `sort`. The key is parsed by `parse_key`,
+    one of number, timestamp or no_key.
+    """
+    try:
+        cursor_sort, key, id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor does not match the requested sort.")
+
+    try:
+        key = parse_key(key)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+
+    if isinstance(id, bool) or not isinstance(id, int):
+        raise InvalidCursor("Invalid cursor.")
+
+    return key, id
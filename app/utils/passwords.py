@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+from .config import settings
+from . import stats
+
+
+myctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def _hash(password: str):
+    return myctx.hash(password)
+
+
+def _verify(password: str, hashed_password: str):
+    return myctx.verify(password, hashed_password)
+
+
+class HashingPool:
+    """
+    Runs bcrypt in worker processes, awaited from async handlers, so hashing
+    neither holds the GIL nor ties up the request threadpool. At most
+    `workers` hashes run at once and `queue_limit` more wait; any beyond that
+    are refused with PoolSaturated.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Workers are spawned, since forking the multithreaded server
+                # could copy locks held by its other threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _discard(self, executor):
+        """Drops `executor` once a worker died, so the next call starts a new pool."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False)
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise PoolSaturated("Too many concurrent password checks.")
+            self.in_flight += 1
+
+        started_at = time.perf_counter()
+        try:
+            # A pool broken by a dead worker is replaced and the call retried once
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    return await asyncio.wrap_future(executor.submit(fn, *args))
+                except BrokenProcessPool:
+                    self._discard(executor)
+                    if attempt:
+                        raise
+        finally:
+            seconds = time.perf_counter() - started_at
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.total_seconds += seconds
+                self.max_seconds = max(self.max_seconds, seconds)
+
+    async def hash(self, password: str):
+        return await self.run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str):
+        return await self.run(_verify, password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_seconds": (self.total_seconds / self.completed
+                if self.completed else None),
+            "max_seconds": self.max_seconds
+        }
+
+
+pool = HashingPool(
+    workers=settings.password_hashing_workers,
+    queue_limit=settings.password_hashing_queue_limit
+)
+
+stats.register("password_hashing", pool.stats)
@@ -0,0 +1,47 @@
+from app.models.product import Product
+from app.models.product_details import ProductDetails
+from app.models.store import Store
+from app.models.events import on_commit
+from .cache import GenerationGuardedCache
+from .config import settings
+from . import stats
+
+
+products = GenerationGuardedCache(
+    maxsize=settings.product_cache_size,
+    ttl=settings.product_cache_ttl_seconds
+)
+
+stats.register("product_cache", products.stats)
+
+
+def generation():
+    return products.generation()
+
+
+def get(product_id: int):
+    """The (ProductOutDetailed dict, ETag, Last-Modified) of the product, or None."""
+    return products.get(product_id)
+
+
+def set(product_id: int, product: tuple, loaded_at: int):
+    """Caches `product`, unless a write committed since `loaded_at` generation()."""
+    products.set(product_id, product, loaded_at)
+
+
+@on_commit(Product, ProductDetails, Store)
+def invalidate(changes):
+    # Every product embeds its store, and which are the store's products is
+    # not known here.
+    if any(change.model is Store for change in changes):
+        products.invalidate()
+        return
+
+    product_ids = []
+    for change in changes:
+        column = "id" if change.model is Product else "product_id"
+        for values in (change.values, change.previous):
+            product_id = values.get(column)
+            if product_id is not None:
+                product_ids.append(product_id)
+    products.invalidate(product_ids)
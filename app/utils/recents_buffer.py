@@ -0,0 +1,142 @@
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from app.models import SessionLocal
+from .config import settings
+from . import stats
+
+
+# Upserts a batch of views, bound as the :user_ids, :product_ids and
+# :created_ats arrays. Views of since deleted users or products are skipped
+# rather than failing the batch.
+UPSERT_RECENTS_SQL = text("""
+    INSERT INTO recents (user_id, product_id, created_at)
+    SELECT v.user_id, v.product_id, v.created_at
+    FROM unnest(
+        CAST(:user_ids AS integer[]),
+        CAST(:product_ids AS integer[]),
+        CAST(:created_ats AS timestamptz[])
+    ) AS v(user_id, product_id, created_at)
+    JOIN users AS u ON u.id = v.user_id
+    JOIN products AS p ON p.id = v.product_id
+    ON CONFLICT (user_id, product_id)
+        DO UPDATE SET created_at = GREATEST(
+            recents.created_at, EXCLUDED.created_at)
+""")
+
+
+class RecentsBuffer:
+    """
+    Coalesces product views in memory, keeping the latest per (user, product),
+    and writes them to recents as one upsert every `interval` seconds, or as
+    soon as `max_entries` are pending.
+    """
+
+    def __init__(self, interval: float, max_entries: int):
+        self.interval = interval
+        self.max_entries = max_entries
+        self.added = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped_on_shutdown = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, user_id: int, product_id: int):
+        with self._lock:
+            key = (user_id, product_id)
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = datetime.now(timezone.utc)
+            self.added += 1
+            full = len(self._pending) >= self.max_entries
+
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Writes the pending views, returning how many could not be written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            started_at = time.perf_counter()
+            try:
+                with SessionLocal() as db:
+                    db.execute(UPSERT_RECENTS_SQL, {
+                        "user_ids": [user_id for user_id, _ in pending],
+                        "product_ids": [product_id for _, product_id in pending],
+                        "created_ats": list(pending.values())
+                    })
+                    db.commit()
+            except Exception as exc:
+                print(exc)
+                self.failed += len(pending)
+                return len(pending)
+
+            seconds = time.perf_counter() - started_at
+            self.flushes += 1
+            self.flushed += len(pending)
+            self.last_batch_size = len(pending)
+            self.max_batch_size = max(self.max_batch_size, len(pending))
+            self.total_flush_seconds += seconds
+            self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+            return 0
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="recents-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the periodic flush and drains the pending views."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dropped_on_shutdown += self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "added": self.added,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "dropped_on_shutdown": self.dropped_on_shutdown,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_seconds": (self.total_flush_seconds / self.flushes
+                if self.flushes else None),
+            "max_flush_seconds": self.max_flush_seconds
+        }
+
+
+buffer = RecentsBuffer(
+    interval=settings.recents_flush_interval_ms / 1000,
+    max_entries=settings.recents_flush_max_entries
+)
+
+stats.register("recents_buffer", buffer.stats)
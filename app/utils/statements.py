@@ -0,0 +1,97 @@
+import re
+import threading
+from .config import settings
+from . import stats
+
+
+BIND_PARAM = re.compile(r"%\((\w+)\)s|%%")
+
+
+class PreparedStatements:
+    """
+    Statements compiled once per shape, i.e. per distinct SQL text, instead of
+    being rebuilt and compiled by SQLAlchemy on every call. With
+    prepared_statements_enabled, each connection also PREPAREs a shape the
+    first time it runs it, so Postgres plans it once per connection.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def execute(self, db, shape, build, params: dict, stream: bool = False):
+        """
+        Runs the statement `build()` returns for `shape`, which must be
+        hashable and identify its SQL text, with the bind `params`. With
+        `stream`, the rows are fetched from a server-side cursor instead, which
+        cannot be declared over an EXECUTE, so the statement is not prepared.
+        """
+        statement = self._statements.get(shape)
+        if statement is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            sql, prepare_sql, param_names = self._compile(db, build())
+            with self._lock:
+                statement = self._statements.get(shape)
+                if statement is None:
+                    name = f"{self.prefix}_{len(self._statements)}"
+                    statement = (name, sql, prepare_sql, param_names)
+                    self._statements[shape] = statement
+
+        name, sql, prepare_sql, param_names = statement
+        connection = db.connection()
+
+        if stream:
+            return connection.execution_options(stream_results=True) \
+                .exec_driver_sql(sql, params)
+
+        if not settings.prepared_statements_enabled:
+            return connection.exec_driver_sql(sql, params)
+
+        prepared = connection.connection.info.setdefault(
+            "prepared_statements", set())
+        if name not in prepared:
+            connection.exec_driver_sql(f"PREPARE {name} AS {prepare_sql}")
+            prepared.add(name)
+
+        if not param_names:
+            return connection.exec_driver_sql(f"EXECUTE {name}")
+
+        placeholders = ", ".join(["%s"] * len(param_names))
+        return connection.exec_driver_sql(
+            f"EXECUTE {name} ({placeholders})",
+            tuple(params[param_name] for param_name in param_names)
+        )
+
+    def _compile(self, db, stmt):
+        sql = str(stmt.compile(dialect=db.get_bind().dialect))
+
+        # PREPARE takes positional $n parameters, one per distinct name
+        param_names = []
+        def positional(match):
+            if match.group(1) is None:
+                return "%"
+            if match.group(1) not in param_names:
+                param_names.append(match.group(1))
+            return f"${param_names.index(match.group(1)) + 1}"
+        prepare_sql = BIND_PARAM.sub(positional, sql)
+
+        return sql, prepare_sql, param_names
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "statements": len(self._statements),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
+
+
+filter_statements = PreparedStatements("filter")
+
+stats.register("filter_statements", filter_statements.stats)
@@ -0,0 +1,10 @@
+_sources = {}
+
+
+def register(name: str, source):
+    """Adds `source()`, a dict of counters, to the /metrics report as `name`."""
+    _sources[name] = source
+
+
+def collect():
+    return {name: source() for name, source in _sources.items()}
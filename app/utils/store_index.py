@@ -0,0 +1,120 @@
+import threading
+import numpy as np
+from app.models import SessionLocal
+from app.models.store import Store
+from app.models.events import on_commit
+from . import geo
+
+
+# Joins the (store_id, distance) pairs resolved by the index into a query,
+# bound as the :store_ids and :distances arrays.
+NEAR_STORES_SQL = """
+    unnest(CAST(:store_ids AS integer[]), CAST(:distances AS float8[]))
+        AS d(store_id, distance)
+"""
+
+
+class StoreIndex:
+    """
+    Every store's id, name and coordinates, sorted by latitude so the stores
+    within a radius are found by a binary search over the latitude band
+    followed by a vectorized haversine over the band.
+    """
+
+    def __init__(self, ids, names, lats, lngs):
+        order = np.argsort(lats, kind="stable")
+        self.ids = ids[order]
+        self.names = names[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+        self.lats_rad = np.radians(self.lats)
+        self.lngs_rad = np.radians(self.lngs)
+        self.cos_lats = np.cos(self.lats_rad)
+
+    @classmethod
+    def load(cls, db):
+        rows = db.query(Store.id, Store.name, Store.lat, Store.lng).all()
+        ids, names, lats, lngs = zip(*rows) if rows else ((), (), (), ())
+        return cls(
+            np.array(ids, dtype=np.int64),
+            np.array([name.casefold() for name in names], dtype=object),
+            np.array(lats, dtype=np.float64),
+            np.array(lngs, dtype=np.float64)
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def within(self, lat: float, lng: float, radius: float, name: str = None):
+        """
+        Returns the (ids, distances) of the stores within `radius` km of
+        (lat, lng), optionally only those whose name contains `name`.
+        """
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius)
+        start = np.searchsorted(self.lats, min_lat, side="left")
+        stop = np.searchsorted(self.lats, max_lat, side="right")
+        band = np.arange(start, stop)
+
+        if min_lng > geo.MIN_LNG or max_lng < geo.MAX_LNG:
+            lngs = self.lngs[band]
+            band = band[(lngs >= min_lng) & (lngs <= max_lng)]
+
+        if name is not None:
+            needle = name.casefold()
+            band = band[np.fromiter(
+                (needle in store_name for store_name in self.names[band]),
+                dtype=bool,
+                count=len(band)
+            )]
+
+        lat_rad, lng_rad = np.radians(lat), np.radians(lng)
+        h = (
+            np.sin((self.lats_rad[band] - lat_rad) / 2) ** 2
+            + np.cos(lat_rad) * self.cos_lats[band]
+            * np.sin((self.lngs_rad[band] - lng_rad) / 2) ** 2
+        )
+        distances = 2 * geo.EARTH_RADIUS_KM * np.arcsin(
+            np.sqrt(np.clip(h, 0, 1)))
+
+        near = distances <= radius
+        return self.ids[band[near]], distances[near]
+
+
+_index = None
+_stale = True
+_lock = threading.Lock()
+
+
+def refresh(only_if_stale: bool = False):
+    """
+    Rebuilds the index from the stores table. With `only_if_stale`, it is not
+    rebuilt again if another caller rebuilt it while this one waited.
+    """
+    global _index, _stale
+
+    with _lock:
+        if only_if_stale and not _stale:
+            return
+        _stale = False
+        try:
+            with SessionLocal() as db:
+                _index = StoreIndex.load(db)
+        except Exception:
+            _stale = True
+            raise
+
+
+def get():
+    """The current index, rebuilt first if stores changed since it was built."""
+    if _stale:
+        try:
+            refresh(only_if_stale=True)
+        except Exception as exc:
+            print(exc)
+    return _index
+
+
+@on_commit(Store)
+def invalidate(changes):
+    global _stale
+    _stale = True
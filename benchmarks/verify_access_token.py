@@ -0,0 +1,32 @@
+"""
+Compares the throughput of verify_access_token with and without the
+verified-token cache, for a single repeated bearer token.
+
+Run from the repository root, with the app's environment configured:
+
+    python -m benchmarks.verify_access_token [iterations]
+"""
+import sys
+import timeit
+from app.utils import auth
+
+
+def main(iterations: int):
+    token = auth.create_access_token(data={"user_id": 1})
+
+    def uncached():
+        auth.verified_tokens.clear()
+        auth.verify_access_token(token)
+
+    def cached():
+        auth.verify_access_token(token)
+
+    auth.verify_access_token(token)
+    for name, fn in (("uncached", uncached), ("cached", cached)):
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=5))
+        print(f"{name:>8}: {iterations / seconds:>12,.0f} verifications/s"
+            f"  ({seconds / iterations * 1e6:.2f} us each)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)